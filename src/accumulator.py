@@ -0,0 +1,217 @@
+"""This file contains the accumulator that folds the trees of a logfile into one weighted
+channel graph.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import networkx as nx
+from helpers import NOT_FOUND, LayerTree
+
+SIZE_STEP = 0.1
+
+
+class GraphAccumulator:  # pylint: disable=too-many-instance-attributes
+    """
+    Accumulates the channel graph of many trees in plain dictionaries. Channels are
+    interned as integers, edge weights and node size increments are counted per subtree,
+    and the networkx graph is only built once by to_graph. The result is the same graph
+    that adding every edge to a networkx graph one at a time would produce, including the
+    order of its nodes and edges.
+
+    A partial accumulator additionally records the order in which nodes and edges were
+    first inserted, so that partial graphs built from consecutive parts of a logfile can
+    be merged into exactly the graph that folding the whole logfile would produce.
+    """
+
+    def __init__(self, not_found: Optional[str] = NOT_FOUND, partial: bool = False) -> None:
+        self.keys: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.nodes: Dict[int, None] = {}
+        self.explicit_size: Set[int] = set()
+        self.size_increments: Counter = Counter()
+        self.edge_weights: Dict[Tuple[int, int], int] = {}
+        self.insertions: Optional[List[Tuple]] = [] if partial else None
+        self.not_found_id = self.intern(not_found) if not_found is not None else None
+
+    def intern(self, key: str) -> int:
+        """
+        Returns the integer ID of a channel, assigning a new one on first sight.
+
+        :param key: The channel name (or channel ID) of a node
+        :return: The interned integer ID
+        """
+        if key not in self.ids:
+            self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return self.ids[key]
+
+    def _insert_node(self, node_id: int) -> None:
+        """Inserts a node into the graph if it is not part of it yet."""
+        if node_id not in self.nodes:
+            self.nodes[node_id] = None
+            if self.insertions is not None:
+                self.insertions.append(("node", node_id))
+
+    def _add_edge(self, u: int, v: int) -> None:
+        """Adds one tree edge between the channels u and v."""
+        not_found = self.not_found_id
+        if v not in self.nodes and u == not_found and v != not_found:
+            self._add_not_found_neighbor(v)
+            return
+        if u not in self.nodes and v == not_found and u != not_found:
+            self._add_not_found_neighbor(u)
+            return
+
+        edge = (u, v) if u <= v else (v, u)
+        if edge in self.edge_weights:
+            self.edge_weights[edge] += 1
+        elif u != v:
+            self._insert_node(u)
+            self._insert_node(v)
+            self.edge_weights[edge] = 1
+            if self.insertions is not None:
+                self.insertions.append(("edge", edge))
+
+    def _add_not_found_neighbor(self, node_id: int) -> None:
+        """
+        Adds a channel that is only connected to a channel that was not found. In a
+        partial accumulator, the channel may already be part of the graph that this
+        partial will be merged into, so the decision is deferred until the merge.
+        """
+        self.nodes[node_id] = None
+        self.explicit_size.add(node_id)
+        if self.insertions is not None:
+            self.insertions.append(("not_found_neighbor", node_id))
+
+    def add_subtree(
+        self,
+        tree: Union[nx.Graph, LayerTree],
+        root: str,
+        video_id_to_key: Dict[str, str],
+        count_root: bool = True,
+    ) -> None:
+        """
+        Folds one tree into the channel graph. Every edge between two videos adds to the
+        weight of the edge between their channels, and every video adds to the size of
+        its channel.
+
+        :param tree: The tree (a networkx graph or LayerTree) of one set of layers
+        :param root: The video ID of the root of the tree
+        :param video_id_to_key: A dictionary mapping the video IDs of the tree to the
+            channel names (or channel IDs) that should be used as nodes
+        :param count_root: If False, the root video does not add to the size of its
+            channel, since it was already counted as a leaf of an earlier tree
+        :return: None
+        """
+        video_id_to_id = {video_id: self.intern(key) for video_id, key in video_id_to_key.items()}
+        for u_video_id, v_video_id in tree.edges():
+            self._add_edge(video_id_to_id[u_video_id], video_id_to_id[v_video_id])
+
+        counted = [
+            video_id_to_id[node]
+            for node in tree.nodes()
+            if video_id_to_id[node] != self.not_found_id and (count_root or node != root)
+        ]
+        for node_id in counted:
+            self._insert_node(node_id)
+        self.size_increments.update(counted)
+
+    def merge(self, partial: "GraphAccumulator") -> None:
+        """
+        Merges a partial accumulator that was built from the lines directly following
+        the lines folded into this accumulator. Edge weights and node size increments are
+        summed, and the recorded insertions are replayed in order.
+
+        :param partial: The partial accumulator to merge into this one
+        :return: None
+        """
+        partial_to_id = [self.intern(key) for key in partial.keys]
+        for kind, item in partial.insertions:
+            if kind == "node":
+                self.nodes.setdefault(partial_to_id[item])
+            elif kind == "edge":
+                edge = tuple(sorted((partial_to_id[item[0]], partial_to_id[item[1]])))
+                self.edge_weights.setdefault(edge, 0)
+            elif partial_to_id[item] in self.nodes:
+                # The channel was already known, so the tree edge to the channel that was
+                # not found is kept as a regular edge
+                node_id = partial_to_id[item]
+                edge = tuple(sorted((node_id, self.not_found_id)))
+                self.nodes.setdefault(self.not_found_id)
+                self.edge_weights[edge] = self.edge_weights.get(edge, 0) + 1
+            else:
+                self.nodes[partial_to_id[item]] = None
+                self.explicit_size.add(partial_to_id[item])
+
+        for (u, v), weight in partial.edge_weights.items():
+            edge = tuple(sorted((partial_to_id[u], partial_to_id[v])))
+            self.edge_weights[edge] += weight
+        for node_id, increments in partial.size_increments.items():
+            self.size_increments[partial_to_id[node_id]] += increments
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the state of the accumulator as a dictionary that can be stored as JSON.
+
+        :return: The state of the accumulator
+        """
+        return {
+            "keys": self.keys,
+            "not_found_id": self.not_found_id,
+            "nodes": list(self.nodes),
+            "explicit_size": sorted(self.explicit_size),
+            "size_increments": list(self.size_increments.items()),
+            "edges": [[u, v, weight] for (u, v), weight in self.edge_weights.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> "GraphAccumulator":
+        """
+        Restores an accumulator from the state returned by to_dict, so that more
+        subtrees can be folded into it.
+
+        :param state: The state of the accumulator
+        :return: The restored accumulator
+        """
+        accumulator = cls(not_found=None)
+        for key in state["keys"]:
+            accumulator.intern(key)
+        accumulator.not_found_id = state["not_found_id"]
+        accumulator.nodes = dict.fromkeys(state["nodes"])
+        accumulator.explicit_size = set(state["explicit_size"])
+        accumulator.size_increments = Counter(dict(state["size_increments"]))
+        accumulator.edge_weights = {(u, v): weight for u, v, weight in state["edges"]}
+        return accumulator
+
+    def node_size(self, node_id: int) -> Optional[float]:
+        """
+        Returns the size of a node, or None if the node never received a size.
+
+        :param node_id: The interned ID of the node
+        :return: The size of the node
+        """
+        increments = self.size_increments[node_id]
+        if node_id not in self.explicit_size and increments == 0:
+            return None
+        size = 1
+        for _ in range(increments):
+            size += SIZE_STEP
+        return size
+
+    def to_graph(self) -> nx.Graph:
+        """
+        Builds the networkx graph from the accumulated nodes and edges.
+
+        :return: The weighted channel graph
+        """
+        graph = nx.Graph()
+        for node_id in self.nodes:
+            size = self.node_size(node_id)
+            if size is None:
+                graph.add_node(self.keys[node_id])
+            else:
+                graph.add_node(self.keys[node_id], size=size)
+        for (u, v), weight in self.edge_weights.items():
+            graph.add_edge(self.keys[u], self.keys[v], weight=weight)
+        return graph
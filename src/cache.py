@@ -0,0 +1,185 @@
+"""This file contains persistent caches that keep the results of network lookups between
+runs.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(CURRENT_DIR, "cache")
+CHANNEL_CACHE_FILE = os.path.join(CACHE_PATH, "channels.sqlite")
+CHANNEL_NAME_TTL = 30 * 24 * 60 * 60
+NOT_FOUND_TTL = 24 * 60 * 60
+RESPONSE_CACHE_PATH = os.path.join(CACHE_PATH, "responses")
+RESPONSE_MAX_AGE = 30 * 24 * 60 * 60
+
+
+class CacheMissError(LookupError):
+    """Raised in replay mode when a response is not in the cache."""
+
+
+class ChannelNameCache:
+    """
+    A persistent channel_id -> channel_name mapping stored in a local SQLite file.
+
+    Channels that could not be resolved are cached as well (negative caching), but they
+    expire after a shorter time so that they will be retried eventually.
+    """
+
+    def __init__(
+        self,
+        path: str = CHANNEL_CACHE_FILE,
+        ttl: int = CHANNEL_NAME_TTL,
+        negative_ttl: int = NOT_FOUND_TTL,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use and evicts all expired entries."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS channels ("
+                "channel_id TEXT PRIMARY KEY, channel_name TEXT, fetched_at REAL)"
+            )
+            self._evict_expired()
+        return self._connection
+
+    def _evict_expired(self) -> None:
+        """Deletes every entry whose time to live has run out."""
+        now = time.time()
+        with self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM channels WHERE (channel_name IS NOT NULL AND fetched_at < ?) "
+                "OR (channel_name IS NULL AND fetched_at < ?)",
+                (now - self.ttl, now - self.negative_ttl),
+            )
+        if cursor.rowcount:
+            logger.info("Evicted %d expired channel names from cache", cursor.rowcount)
+
+    def lookup(self, channel_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Looks up channel names in the cache.
+
+        :param channel_ids: The IDs of the channels to look up
+        :return: A dictionary containing an entry for every cached channel ID. Channels
+            that are cached as not found map to None
+        """
+        now = time.time()
+        cached = {}
+        with self._lock:
+            connection = self._connect()
+            for channel_id in set(channel_ids):
+                row = connection.execute(
+                    "SELECT channel_name, fetched_at FROM channels WHERE channel_id = ?",
+                    (channel_id,),
+                ).fetchone()
+                if row is None:
+                    continue
+                channel_name, fetched_at = row
+                ttl = self.ttl if channel_name is not None else self.negative_ttl
+                if fetched_at >= now - ttl:
+                    cached[channel_id] = channel_name
+        return cached
+
+    def store(self, channel_names: Dict[str, Optional[str]]) -> None:
+        """
+        Stores resolved channel names in the cache.
+
+        :param channel_names: A dictionary mapping channel IDs to channel names, where
+            None marks a channel that could not be found
+        """
+        if not channel_names:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO channels VALUES (?, ?, ?)",
+                    [
+                        (channel_id, channel_name, now)
+                        for channel_id, channel_name in channel_names.items()
+                    ],
+                )
+
+
+class ResponseCache:
+    """
+    A content-addressed on-disk cache of raw Youtube Data API responses. Every response
+    is stored as a JSON file named after the hash of its key. In replay mode, responses
+    are served from the cache only and a cache miss raises a CacheMissError, so that a
+    crawl can be repeated without spending any quota or touching the network.
+    """
+
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_PATH,
+        max_age: Optional[int] = RESPONSE_MAX_AGE,
+        replay: bool = False,
+    ) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.replay = replay
+
+    def _file(self, key: Tuple) -> str:
+        """Returns the path of the file that stores the response for a key."""
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest[:2], f"{digest}.json")
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """
+        Returns the cached response for a key.
+
+        :param key: The key of the response, e.g. ("related", video_id, width)
+        :return: The cached response, or None if it is not cached or has expired
+        """
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            entry = None
+
+        expired = (
+            entry is not None
+            and not self.replay
+            and self.max_age is not None
+            and entry["fetched_at"] < time.time() - self.max_age
+        )
+        if entry is None or expired:
+            if self.replay:
+                raise CacheMissError(f"No cached response for: {key}")
+            return None
+        return entry["response"]
+
+    def put(self, key: Tuple, response: Any) -> None:
+        """
+        Stores a response in the cache, replacing the file atomically.
+
+        :param key: The key of the response
+        :param response: The raw response, which must be serializable as JSON
+        """
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"key": key, "fetched_at": time.time(), "response": response}, file)
+        os.replace(temp_path, file_path)
+
+
+channel_name_cache = ChannelNameCache()
+response_cache = ResponseCache()
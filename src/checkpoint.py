@@ -0,0 +1,113 @@
+"""This file contains the checkpoints that record how far the calculation of a large tree
+has come, so that it can be continued after the process was stopped or killed.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List
+
+from logstore import (
+    LogWriter,
+    checkpoint_path,
+    count_lines,
+    lines_end,
+    trim_partial_line,
+    truncate_log,
+)
+
+logger = logging.getLogger(__name__)
+
+
+CHECKPOINT_VERSION = 1
+
+
+def _fsync_directory(path: str) -> None:
+    """Flushes a directory entry to disk, where the operating system supports it."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    directory = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def write_checkpoint(writer: LogWriter, state: List[int]) -> None:
+    """
+    Atomically saves the state of a tree calculation together with the number of lines
+    and the byte size of its logfile. The logfile is flushed to disk first, and the
+    checkpoint is written to a temporary file that replaces the previous checkpoint
+    only once it is on disk, so that a checkpoint never refers to lost data and is never
+    half-written.
+
+    :param writer: The writer of the logfile, with every finished tree appended
+    :param state: The state [start_line, current_leaf_index, current_leafs, next_leafs,
+        current_depth] from which the calculation continues
+    :return: None
+    """
+    writer.sync()
+    path = checkpoint_path(writer.logpath)
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "state": state,
+        "log_lines": writer.line_count,
+        "log_offset": writer.offset,
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def read_checkpoint(logpath: str) -> Dict:
+    """
+    Reads the checkpoint of a logfile. Breakpoint files in the legacy format (five
+    integers on separate lines) are understood as well, but they only contain the state.
+
+    :param logpath: The path to the logfile
+    :return: A dictionary containing the state, and for current checkpoints the number
+        of lines and the byte size of the logfile at the time of the checkpoint
+    """
+    with open(checkpoint_path(logpath), "r", encoding="utf-8") as file:
+        content = file.read()
+    if content.lstrip().startswith("{"):
+        return json.loads(content)
+
+    state = [0, 0, 0, 0, 0]
+    for line_index, line in enumerate(content.splitlines()):
+        state[line_index] = int(line.strip())
+    return {"state": state}
+
+
+def restore_checkpoint(logpath: str) -> List[int]:
+    """
+    Reads the checkpoint of a logfile and trims the logfile to the last record that is
+    covered by it, so that trees which were written after the checkpoint (or were only
+    partly written when the process was killed) are calculated again instead of being
+    duplicated. The logfile is cut where its offset index says the saved number of lines
+    end, which only differs from the saved byte offset if the logfile was rewritten in
+    the meantime, e.g. migrated to another format.
+
+    :param logpath: The path to the logfile
+    :return: The state [start_line, current_leaf_index, current_leafs, next_leafs,
+        current_depth] from which the calculation continues
+    """
+    checkpoint = read_checkpoint(logpath)
+    line_count = checkpoint.get("log_lines")
+    if line_count is None or count_lines(logpath) < line_count:
+        trim_partial_line(logpath)
+        return checkpoint["state"]
+
+    offset = lines_end(logpath, line_count)
+    if offset != checkpoint.get("log_offset"):
+        logger.warning(
+            "The checkpoint does not match the byte offsets of the logfile, using its offset "
+            "index instead: %s",
+            logpath,
+        )
+    truncate_log(logpath, line_count, offset)
+    return checkpoint["state"]
@@ -0,0 +1,106 @@
+"""This file contains the crawler that expands related videos for the force mode, making
+sure that no video is expanded twice during one run.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from helpers import get_layers, get_related
+from keypool import KeyPool
+from quota import tree_cost
+
+logger = logging.getLogger(__name__)
+
+
+class VisitedVideos:  # pylint: disable=too-few-public-methods
+    """
+    The videos expanded during one run, shared by every crawler of the run. Every video
+    maps to a future of its related videos, which is added before the video is fetched,
+    so that a crawler that reaches a video while another crawler is still fetching it
+    waits for that fetch instead of starting a second one.
+    """
+
+    def __init__(self) -> None:
+        self.expansions: Dict[str, Future] = {}
+        self.saved_expansions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.expansions)
+
+
+class Crawler:
+    """
+    Breadth-first crawler over related videos. The logfile acts as the frontier queue
+    (every line appends the leaves of one subtree to it), while the crawler keeps a visited
+    set of every video it has expanded in this run together with its related videos. A
+    video that appears under several leaves is therefore only fetched from the Youtube
+    Data API once. Several crawlers (e.g. one per thread) can share one visited set.
+    """
+
+    def __init__(
+        self, youtube: Any, width: int, depth: int, visited: Optional[VisitedVideos] = None
+    ) -> None:
+        self.youtube = youtube
+        self.width = width
+        self.depth = depth
+        self.visited = visited if visited is not None else VisitedVideos()
+
+    def expand(self, video_id: str) -> Dict:
+        """
+        Returns the related videos of a video, fetching them only if the video has not
+        been expanded before. If another crawler is fetching the video at the same time,
+        waits for its result.
+
+        :param video_id: The ID of the Youtube video to expand
+        :return: A dictionary in the format returned by get_related
+        """
+        with self.visited.lock:
+            future = self.visited.expansions.get(video_id)
+            fetching = future is None
+            if fetching:
+                future = self.visited.expansions[video_id] = Future()
+            else:
+                self.visited.saved_expansions += 1
+
+        if fetching:
+            try:
+                future.set_result(get_related(self.youtube, video_id, self.width))
+            except Exception as error:
+                # Forget the failed expansion so that the video can be fetched again later
+                with self.visited.lock:
+                    del self.visited.expansions[video_id]
+                future.set_exception(error)
+                raise
+        return dict(future.result())
+
+    def get_layers(self, video_id: str) -> List[Dict]:
+        """
+        Calculates the layers of related videos for a leaf, in the same format as
+        get_layers, reusing every expansion that has already been done.
+
+        :param video_id: The ID of the Youtube video to start with
+        :return: The layers of related videos
+        """
+        return get_layers(self.youtube, video_id, self.width, self.depth, expand=self.expand)
+
+    def can_afford_tree(self) -> bool:
+        """
+        Checks whether the quota left is enough for one more tree. API objects that do
+        not keep track of their quota are assumed to have enough.
+
+        :return: True if another tree can be calculated, otherwise False
+        """
+        if not isinstance(self.youtube, KeyPool):
+            return True
+        return self.youtube.can_afford(tree_cost(self.width, self.depth))
+
+    def log_stats(self) -> None:
+        """Logs how many expansions were saved by the visited set."""
+        logger.info(
+            "Expanded %d videos, skipped %d duplicate expansions",
+            len(self.visited),
+            self.visited.saved_expansions,
+        )
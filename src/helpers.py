@@ -2,14 +2,25 @@
 of related videos.
 """
 
+import functools
+import hashlib
 import logging
+import math
 import os
 import random
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import googleapiclient.http
 import networkx as nx
 import requests
+from cache import channel_name_cache, response_cache
+from logstore import write_layers
+from ratelimit import LIST_COST, SEARCH_COST, rate_limiter
+from records import VideoRecord
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +30,32 @@ DATA_PATH = os.path.join(CURRENT_DIR, "data")
 YOUTUBE_BASE = "https://www.youtube.com/watch?v="
 NOEMBED_URL = "https://noembed.com/embed?url="
 OEMBED_URL = "https://www.youtube.com/oembed?url="
+MAX_IDS_PER_CALL = 50
+NOT_FOUND = "Not Found"
+EMBED_NOT_FOUND_STATUS = (401, 404)
+LAYER_WORKERS = 8
+BLOOM_ERROR_RATE = 1e-6
+
+_video_infos: Dict[str, Tuple[str, str]] = {}
+_thread_local = threading.local()
+
+
+def execute(request: Any, cost: int) -> Dict:
+    """
+    Executes a Youtube Data API request once the rate limiter allows it. The Youtube Data
+    API object is not thread-safe, so requests sent from worker threads use an HTTP
+    connection of their own.
+
+    :param request: The request built from the Youtube Data API object
+    :param cost: The cost of the request in quota units
+    :return: The response of the request
+    """
+    rate_limiter.acquire(cost)
+    if threading.current_thread() is threading.main_thread():
+        return request.execute()
+    if not hasattr(_thread_local, "http"):
+        _thread_local.http = googleapiclient.http.build_http()
+    return request.execute(http=_thread_local.http)
 
 
 def parse_video_id(link: str) -> Optional[str]:
@@ -34,6 +71,53 @@ def parse_video_id(link: str) -> Optional[str]:
     return video_id
 
 
+def get_video_infos(youtube: Any, video_ids: List[str]) -> Dict[str, Tuple[str, str]]:
+    """
+    Takes a list of Youtube video IDs and returns the title and channel ID of every
+    video. Videos that have not been looked up before are requested in batches of up to
+    50 IDs per call, and all results are memoized and kept in the response cache so that
+    no video is looked up twice.
+
+    :param youtube: The Youtube Data API object
+    :param video_ids: The IDs of the Youtube videos
+    :return: A dictionary mapping every video ID that could be found to a tuple
+        containing the title and channel ID of the video
+    """
+    for video_id in dict.fromkeys(video_ids):
+        item = response_cache.get(("video", video_id)) if video_id not in _video_infos else None
+        if item is not None:
+            _video_infos[video_id] = (item["snippet"]["title"], item["snippet"]["channelId"])
+
+    missing = [video_id for video_id in dict.fromkeys(video_ids) if video_id not in _video_infos]
+    for batch_start in range(0, len(missing), MAX_IDS_PER_CALL):
+        batch = missing[batch_start : batch_start + MAX_IDS_PER_CALL]
+        response = execute(
+            youtube.videos().list(part="snippet", id=",".join(batch), maxResults=MAX_IDS_PER_CALL),
+            LIST_COST,
+        )
+        for item in response["items"]:
+            response_cache.put(("video", item["id"]), item)
+            _video_infos[item["id"]] = (item["snippet"]["title"], item["snippet"]["channelId"])
+
+    return {video_id: _video_infos[video_id] for video_id in video_ids if video_id in _video_infos}
+
+
+def prefetch_video_infos(youtube: Any, video_ids: List[str]) -> None:
+    """
+    Looks up the title and channel ID of several videos in batches before they are
+    expanded one by one. Errors are only logged, since every video that is still missing
+    is looked up again when it is expanded.
+
+    :param youtube: The Youtube Data API object
+    :param video_ids: The IDs of the Youtube videos
+    :return: None
+    """
+    try:
+        get_video_infos(youtube, video_ids)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.warning("Could not prefetch the video infos: %s", error)
+
+
 def get_video_info(youtube: Any, video_id: str) -> Tuple[str, str]:
     """
     Takes a Youtube video ID and returns the title and channel ID of the video.
@@ -42,9 +126,7 @@ def get_video_info(youtube: Any, video_id: str) -> Tuple[str, str]:
     :param video_id: The ID of the Youtube video
     :return: A tuple containing the title and channel ID of the video
     """
-    response = youtube.videos().list(part="snippet", id=video_id).execute()
-    title = response["items"][0]["snippet"]["title"]
-    channel_id = response["items"][0]["snippet"]["channelId"]
+    title, channel_id = get_video_infos(youtube, [video_id])[video_id]
     return title, channel_id
 
 
@@ -56,12 +138,41 @@ def get_channel_name(youtube: Any, channel_id: str) -> str:
     :param channel_id: The ID of the Youtube channel
     :return: The name of the Youtube channel
     """
-    response = youtube.channels().list(part="snippet", id=channel_id).execute()
+    response = execute(youtube.channels().list(part="snippet", id=channel_id), LIST_COST)
     channel_name = response["items"][0]["snippet"]["title"]
     return channel_name
 
 
-def get_channel_name_embed(video_id: str, noembed: bool) -> Optional[str]:
+def get_channel_names(youtube: Any, channel_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Takes a list of Youtube channel IDs and returns the names of the channels, requesting
+    up to 50 channels per call to the Youtube Data API. The names of every batch are
+    stored in the channel name cache as soon as the batch returns, so that they are not
+    lost if a later batch fails.
+
+    :param youtube: The Youtube Data API object
+    :param channel_ids: The IDs of the Youtube channels
+    :return: A dictionary mapping every channel ID to its channel name, or to None if the
+        channel could not be found
+    """
+    channel_id_to_channel_name = dict.fromkeys(channel_ids)
+    for batch_start in range(0, len(channel_ids), MAX_IDS_PER_CALL):
+        batch = channel_ids[batch_start : batch_start + MAX_IDS_PER_CALL]
+        response = execute(
+            youtube.channels().list(
+                part="snippet", id=",".join(batch), maxResults=MAX_IDS_PER_CALL
+            ),
+            LIST_COST,
+        )
+        batch_names = dict.fromkeys(batch)
+        for item in response.get("items", []):
+            batch_names[item["id"]] = item["snippet"]["title"]
+        channel_name_cache.store(batch_names)
+        channel_id_to_channel_name.update(batch_names)
+    return channel_id_to_channel_name
+
+
+def get_channel_name_embed(video_id: str, noembed: bool, session: Any = requests) -> Optional[str]:
     """
     Takes a Youtube channel ID and returns the name of the channel using oembed or
     noembed.
@@ -69,209 +180,319 @@ def get_channel_name_embed(video_id: str, noembed: bool) -> Optional[str]:
     :param video_id: The ID of the Youtube video
     :param noembed: If True, uses noembed.com to fetch the channel name, otherwise uses
         youtube.com/oembed
-    :return: The name of the Youtube channel or None if the request fails
+    :param session: The requests session (or the requests module) used to send the request
+    :return: The name of the Youtube channel or None if the video (and thus its channel)
+        could not be found
+    :raises requests.RequestException: If the request failed for any other reason, e.g.
+        a timeout or a server error, so that the channel may still exist
     """
-    try:
-        if noembed:
-            response = requests.get(
-                NOEMBED_URL + YOUTUBE_BASE + video_id,
-                timeout=10,
-            )
-        else:
-            response = requests.get(
-                OEMBED_URL + YOUTUBE_BASE + video_id,
-                timeout=10,
+    if noembed:
+        response = session.get(
+            NOEMBED_URL + YOUTUBE_BASE + video_id,
+            timeout=10,
+        )
+    else:
+        response = session.get(
+            OEMBED_URL + YOUTUBE_BASE + video_id,
+            timeout=10,
+        )
+    if response.status_code in EMBED_NOT_FOUND_STATUS:
+        return None
+    response.raise_for_status()
+    video_info = response.json()
+    return video_info.get("author_name") if isinstance(video_info, dict) else None
+
+
+class ChannelNameResolver:
+    """
+    Resolves the channel names of many videos concurrently. All requests share one pooled
+    keep-alive session that retries failed requests with exponential backoff, and the
+    number of requests in flight to each host is limited.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        max_per_host: int = 8,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ) -> None:
+        self.session = requests.Session()
+        retry = requests.adapters.Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2, pool_maxsize=max_per_host, max_retries=retry
+        )
+        self.session.mount("https://", adapter)
+        self.host_limits = {
+            True: threading.BoundedSemaphore(max_per_host),
+            False: threading.BoundedSemaphore(max_per_host),
+        }
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _fetch(self, video_id: str, noembed: bool) -> Optional[str]:
+        """Fetches a single channel name while respecting the per-host limit."""
+        with self.host_limits[noembed]:
+            return get_channel_name_embed(video_id, noembed, session=self.session)
+
+    def resolve(self, channel_id_to_video_id: Dict, use_noembed: bool = False) -> Dict:
+        """
+        Resolves the names of a batch of channels, skipping channels that are already in
+        the channel name cache.
+
+        :param channel_id_to_video_id: A dictionary mapping channel IDs to the ID of any
+            video uploaded by that channel
+        :param use_noembed: If True, uses noembed.com to fetch channel names, otherwise
+            uses youtube.com/oembed
+        :return: A dictionary mapping every channel ID to its channel name, or to None
+            if the channel could not be found. Channels whose lookup failed for another
+            reason (e.g. a timeout) are left out and are not cached, so that they are
+            looked up again next time
+        """
+        channel_id_to_channel_name = channel_name_cache.lookup(channel_id_to_video_id.keys())
+        missing = [
+            channel_id
+            for channel_id in channel_id_to_video_id
+            if channel_id not in channel_id_to_channel_name
+        ]
+        futures = [
+            self.executor.submit(self._fetch, channel_id_to_video_id[channel_id], use_noembed)
+            for channel_id in missing
+        ]
+        resolved = {}
+        for channel_id, future in zip(missing, futures):
+            try:
+                resolved[channel_id] = future.result()
+            except requests.RequestException as error:
+                logger.debug("Could not look up channel %s: %s", channel_id, error)
+        if len(resolved) < len(missing):
+            logger.warning(
+                "Could not look up %d channel names, they will be retried next time",
+                len(missing) - len(resolved),
             )
-        response.raise_for_status()
-        video_info = response.json()
-        return video_info["author_name"]
+        channel_name_cache.store(resolved)
 
-    except (requests.RequestException, KeyError):
-        return None
+        channel_id_to_channel_name.update(resolved)
+        return channel_id_to_channel_name
+
+    def close(self) -> None:
+        """Waits for all pending requests and closes the pooled session."""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+channel_name_resolver = ChannelNameResolver()
 
 
 def get_related(youtube: Any, video_id: str, width: int) -> Dict:
     """
-    Takes a video ID and returns related videos via the Youtube Data API.
+    Takes a video ID and returns related videos via the Youtube Data API. Responses are
+    served from the response cache if possible.
 
     :param youtube: The Youtube Data API object
     :param video_id: The ID of the Youtube video
     :param width: The number of related videos to retrieve
-    :return: A dictionary containing related video IDs as keys and a list of [video_id,
-        title, channel_id] as values
+    :return: A dictionary containing related video IDs as keys and a VideoRecord of
+        [video_id, title, channel_id] as values
     """
     # NOTE: As of March 2023, the Youtube Data API v3 does not support
     # retrieving related videos for a specific video ID any longer.
     # So this function will have to be rewritten to use a different method for
     # retrieving related videos.
-    response = (
-        youtube.search()
-        .list(part="snippet", relatedToVideoId=video_id, maxResults=width, type="video")
-        .execute()
-    )
+    response = response_cache.get(("related", video_id, width))
+    if response is None:
+        response = execute(
+            youtube.search().list(
+                part="snippet", relatedToVideoId=video_id, maxResults=width, type="video"
+            ),
+            SEARCH_COST,
+        )
+        response_cache.put(("related", video_id, width), response)
 
     related_videos = {}
     for item in response["items"]:
         related_video_id = item["id"]["videoId"]
         title = item["snippet"]["title"]
         channel_id = item["snippet"]["channelId"]
-        related_videos[related_video_id] = [video_id, title, channel_id]
+        related_videos[sys.intern(related_video_id)] = VideoRecord(video_id, title, channel_id)
 
     return related_videos
 
 
-def get_layers(youtube: Any, video_id: str, width: int, depth: int) -> List[Dict]:
+def get_layers(
+    youtube: Any,
+    video_id: str,
+    width: int,
+    depth: int,
+    expand: Optional[Callable[[str], Dict]] = None,
+    max_workers: int = LAYER_WORKERS,
+) -> List[Dict]:
     """
-    Calculates the layers of related videos with the help of get_related.
+    Calculates the layers of related videos with the help of get_related. All videos of
+    a layer are expanded concurrently, but the results are merged in the order of the
+    previous layer so that the layers are the same as with sequential expansion.
 
     :param youtube: The Youtube Data API object
     :param video_id: The ID of the Youtube video to start with
     :param width: The number of related videos to retrieve at each layer
     :param depth: The number of layers to retrieve
+    :param expand: A function that returns the related videos of a video ID (if not
+        provided, get_related will be called directly)
+    :param max_workers: The maximum number of videos that are expanded at the same time
     :return: A list of dictionaries, where each dictionary represents a layer of related
-        videos. Each dictionary contains video IDs as keys and a list of [related_to,
-        title, channel_id] as values
+        videos. Each dictionary contains video IDs as keys and a VideoRecord of
+        [related_to, title, channel_id] as values
     """
+    expand = expand or functools.partial(get_related, youtube, width=width)
+
     title, channel_id = get_video_info(youtube, video_id)
     layers = [{} for _ in range(depth + 1)]
-    layers[0] = {video_id: [None, title, channel_id]}
+    layers[0] = {sys.intern(video_id): VideoRecord(None, title, channel_id)}
 
-    for layer_depth in range(1, depth + 1):
-        if layer_depth == 1:
-            layers[layer_depth] = get_related(youtube, video_id, width)
-        else:
-            for video in layers[layer_depth - 1]:
-                related = get_related(youtube, video, width)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for layer_depth in range(1, depth + 1):
+            for related in executor.map(expand, list(layers[layer_depth - 1])):
                 layers[layer_depth].update(related)
 
     return layers
 
 
-def save_layers(layers: List[Dict], video_id: str) -> None:
+def save_layers(
+    layers: List[Dict], video_id: str, normalized: bool = False, compressed: bool = False
+) -> None:
     """
     Saves the layers of related videos to a file.
 
     :param layers: The layers of related videos
     :param video_id: The ID of the Youtube video for which the layers were calculated
+    :param normalized: If True, the logfile is stored in the normalized format
+    :param compressed: If True, the logfile is stored as compressed frames
     """
-    with open(f"{DATA_PATH}/{video_id}.log", "w", encoding="utf-8") as logfile:
-        print(layers, file=logfile)
+    write_layers(f"{DATA_PATH}/{video_id}.log", layers, normalized, compressed)
 
 
-def video_id_to_title_dict(layers: List[Dict], tree: nx.Graph) -> Dict:
+class LayerIndex:  # pylint: disable=too-few-public-methods
     """
-    Takes the layers returned by get_layers and converts them into a dictionary mapping
-    video IDs to video titles.
-
-    :param layers (List[Dict]): The layers that were returned by get_layers
-    :return: A dictionary containing video IDs as keys and titles as values
+    Index of one set of layers that is built in a single pass over the layers. It maps
+    every video to its title and channel, lists the tree edges in the order of the layers
+    and maps every channel to its first video, so that the tree, its colors and its labels
+    can be derived without scanning the layers again.
     """
-    video_id_to_title = {}
-    for layer in layers:
-        for video_id, video_info in layer.items():
-            video_id_to_title[video_id] = video_info[1]
 
-    video_id_to_title = {
-        node: video_id_to_title[node] for node in tree.nodes() if node in video_id_to_title
+    def __init__(self, layers: List[Dict]) -> None:
+        self.title: Dict[str, str] = {}
+        self.channel: Dict[str, str] = {}
+        self.channels: Dict[str, str] = {}
+        self.edges: List[Tuple[str, str]] = []
+        for layer in layers:
+            for video_id, video_info in layer.items():
+                parent_video_id, title, channel_id = video_info
+                self.title[video_id] = title
+                self.channel[video_id] = channel_id
+                self.channels.setdefault(channel_id, video_id)
+                if parent_video_id is not None:
+                    self.edges.append((parent_video_id, video_id))
+        self.root = next(iter(layers[0]))
+
+
+def _tree_channels(index: LayerIndex, tree: nx.Graph) -> Dict[str, str]:
+    """Returns the channels of the index whose first video is part of the tree, mapped to
+    that video, in the order of the layers.
+    """
+    nodes = set(tree.nodes())
+    return {
+        channel_id: video_id for channel_id, video_id in index.channels.items() if video_id in nodes
     }
 
-    return video_id_to_title
-
 
-def video_id_to_channel_id_dict(layers: List[Dict], tree: nx.Graph) -> Dict:
+def video_id_to_title_dict(index: LayerIndex, tree: nx.Graph) -> Dict:
     """
-    Takes the layers returned by get_layers and converts them into a dictionary mapping
-    video IDs to channel IDs.
+    Takes the index of the layers returned by get_layers and returns a dictionary mapping
+    the video IDs of the tree to video titles.
 
-    :param layers (List[Dict]): The layers that were returned by get_layers
-    :return: A dictionary containing video IDs as keys and channel IDs as values
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
+    :param tree (nx.Graph): The tree representation of the layers
+    :return: A dictionary containing video IDs as keys and titles as values
     """
-    video_id_to_channel_id = {}
-    for layer in layers:
-        for video_id, video_info in layer.items():
-            video_id_to_channel_id[video_id] = video_info[2]
+    return {node: index.title[node] for node in tree.nodes() if node in index.title}
 
-    video_id_to_channel_id = {
-        node: video_id_to_channel_id[node]
-        for node in tree.nodes()
-        if node in video_id_to_channel_id
-    }
 
-    return video_id_to_channel_id
+def video_id_to_channel_id_dict(index: LayerIndex, tree: nx.Graph) -> Dict:
+    """
+    Takes the index of the layers returned by get_layers and returns a dictionary mapping
+    the video IDs of the tree to channel IDs.
+
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
+    :param tree (nx.Graph): The tree representation of the layers
+    :return: A dictionary containing video IDs as keys and channel IDs as values
+    """
+    return {node: index.channel[node] for node in tree.nodes() if node in index.channel}
 
 
 def channel_id_to_channel_name_dict(
-    layers: List[Dict], tree: nx.Graph, use_noembed: bool = False
+    index: LayerIndex, tree: nx.Graph, use_noembed: bool = False
 ) -> Dict:
     """
-    Takes a dictionary mapping video IDs to channel IDs and returns a dictionary mapping
-    channel IDs to channel names by querying the Youtube Data API.
+    Takes the index of the layers and returns a dictionary mapping the channel IDs of the
+    tree to channel names by querying oembed or noembed. Channel names are looked up in
+    the persistent channel name cache first and the remaining ones are resolved
+    concurrently.
 
-    :param youtube: The Youtube Data API object
-    :param video_id_to_channel_id: A dictionary mapping video IDs to channel IDs
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
+    :param tree (nx.Graph): The tree representation of the layers
+    :param use_noembed (bool): If True, uses noembed.com to fetch channel names,
+        otherwise uses youtube.com/oembed
     :return: A dictionary mapping channel IDs to channel names
     """
-    video_id_to_channel_id = video_id_to_channel_id_dict(layers, tree)
-
-    filtered_video_id_to_channel_id = {}
-    for video_id, channel_id in video_id_to_channel_id.items():
-        if channel_id not in filtered_video_id_to_channel_id.values():
-            filtered_video_id_to_channel_id[video_id] = channel_id
-
-    channel_id_to_channel_name = {
-        channel_id: get_channel_name_embed(video_id, use_noembed)
-        for video_id, channel_id in filtered_video_id_to_channel_id.items()
+    channel_id_to_video_id = _tree_channels(index, tree)
+    resolved = channel_name_resolver.resolve(channel_id_to_video_id, use_noembed=use_noembed)
+    return {
+        channel_id: resolved.get(channel_id) or NOT_FOUND for channel_id in channel_id_to_video_id
     }
 
-    for channel_id, channel_name in channel_id_to_channel_name.items():
-        if channel_name is None:
-            channel_id_to_channel_name[channel_id] = "Not Found"
-
-    return channel_id_to_channel_name
-
 
 def video_id_to_channel_name_dict(
-    layers: List[Dict], tree: nx.Graph, use_noembed: bool = False
+    index: LayerIndex,
+    tree: nx.Graph,
+    use_noembed: bool = False,
+    channel_id_to_channel_name: Optional[Dict] = None,
 ) -> Dict:
     """
-    Takes the layers returned by get_layers and converts them into a dictionary mapping
-    video IDs to channel names by querying the Youtube Data API or using noembed.
+    Takes the index of the layers returned by get_layers and returns a dictionary mapping
+    the video IDs of the tree to channel names by querying oembed or noembed.
 
-    :param layers (List[Dict]): The layers that were returned by get_layers
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
     :param tree (nx.Graph): The tree representation of the layers
     :param use_noembed (bool): If True, uses noembed.com to fetch channel names,
         otherwise uses youtube.com/oembed
+    :param channel_id_to_channel_name (Dict): Already resolved channel names, where None
+        marks a channel that could not be found (if provided, no requests will be sent)
     :return: A dictionary containing video IDs as keys and channel names as values
     """
-    video_id_to_channel_id = video_id_to_channel_id_dict(layers, tree)
-    channel_id_to_channel_name = channel_id_to_channel_name_dict(
-        layers, tree, use_noembed=use_noembed
-    )
-
-    video_id_to_channel_name = {
-        video_id: channel_id_to_channel_name[channel_id]
-        for video_id, channel_id in video_id_to_channel_id.items()
+    if channel_id_to_channel_name is None:
+        channel_id_to_channel_name = channel_id_to_channel_name_dict(
+            index, tree, use_noembed=use_noembed
+        )
+
+    return {
+        video_id: channel_id_to_channel_name[channel_id] or NOT_FOUND
+        for video_id, channel_id in video_id_to_channel_id_dict(index, tree).items()
         if channel_id in channel_id_to_channel_name
     }
 
-    video_id_to_channel_name = {
-        node: video_id_to_channel_name[node]
-        for node in tree.nodes()
-        if node in video_id_to_channel_name
-    }
-
-    return video_id_to_channel_name
 
-
-def get_colors(layers: List[Dict], tree: nx.Graph) -> List[str]:
+def get_colors(index: LayerIndex, tree: nx.Graph) -> List[str]:
     """
-    Takes the layers generated in get_layers and their tree representation and returns a
-    coloring according to the Youtube channels.
+    Takes the index of the layers generated in get_layers and their tree representation
+    and returns a coloring according to the Youtube channels.
 
-    :param layers (List[Dict]): The layers that were returned by get_layers
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
     :param tree (nx.Graph): The tree representation of the layers
-    :return: A tuple containing a list of colors for each node in the tree and a
-        dictionary mapping video IDs to channel IDs
+    :return: A list of colors for each node in the tree
     """
     colors = [
         "gold",
@@ -287,37 +508,92 @@ def get_colors(layers: List[Dict], tree: nx.Graph) -> List[str]:
         "limegreen",
     ] * 10
 
-    video_id_to_channel_id = video_id_to_channel_id_dict(layers, tree)
-    unique_channel_ids = list(set(video_id_to_channel_id.values()))
-    channel_id_to_color = {channel_id: colors[i] for i, channel_id in enumerate(unique_channel_ids)}
-    node_to_color = {
-        node: channel_id_to_color[video_id_to_channel_id[node]] for node in tree.nodes()
+    video_id_to_channel_id = video_id_to_channel_id_dict(index, tree)
+    channel_id_to_color = {
+        channel_id: colors[i] for i, channel_id in enumerate(_tree_channels(index, tree))
     }
-    colorings = [node_to_color.get(node, "red") for node in tree.nodes()]
+    colorings = [
+        channel_id_to_color[video_id_to_channel_id[node]]
+        if node in video_id_to_channel_id
+        else "red"
+        for node in tree.nodes()
+    ]
 
     return colorings
 
 
-def get_tree(layers: List[Dict]) -> tuple[nx.Graph, str]:
+def get_tree(index: LayerIndex) -> tuple[nx.Graph, str]:
     """
     Converts the layers generated in get_layers to a tree, which can then be visualized.
 
-    :param layers (List[Dict]): The layers that were returned by get_layers
+    :param index (LayerIndex): The index of the layers that were returned by get_layers
     :return: A tuple containing the tree as a networkx Graph and the root node ID
     """
     tree = nx.Graph()
-    for layer in layers:
-        for video_id, video_info in layer.items():
-            parent_video_id = video_info[0]
-            if parent_video_id is not None:
-                tree.add_edge(parent_video_id, video_id)
-
-    root_layer = layers[0]
-    root_layer_video_ids = list(root_layer.keys())
-    root_video_id = root_layer_video_ids[0]
-    root = root_video_id
-
-    return tree, root
+    tree.add_edges_from(index.edges)
+    return tree, index.root
+
+
+class LayerTree:
+    """
+    Lightweight view of the tree spanned by a set of layers. It lists the nodes and edges
+    in exactly the same order as the networkx graph returned by get_tree, but only keeps
+    an adjacency dictionary, so converting many trees does not build a graph for each of
+    them.
+    """
+
+    def __init__(self, index: LayerIndex) -> None:
+        self.adjacency: Dict[str, Dict[str, None]] = {}
+        for parent_video_id, video_id in index.edges:
+            self.adjacency.setdefault(parent_video_id, {})[video_id] = None
+            self.adjacency.setdefault(video_id, {})[parent_video_id] = None
+        self.root = index.root
+
+    def nodes(self) -> List[str]:
+        """Returns the video IDs of the tree in insertion order."""
+        return list(self.adjacency)
+
+    def edges(self) -> List[Tuple[str, str]]:
+        """Returns the edges of the tree in the order networkx would report them."""
+        edges, seen = [], set()
+        for node, neighbors in self.adjacency.items():
+            for neighbor in neighbors:
+                if neighbor not in seen:
+                    edges.append((node, neighbor))
+            seen.add(node)
+        return edges
+
+
+class BloomFilter:  # pylint: disable=too-few-public-methods
+    """
+    A fixed-size set of strings that may report false positives but never false
+    negatives. Its memory use is determined by the capacity and error rate alone, no
+    matter how many strings are added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key: str) -> bool:
+        """
+        Adds a string to the filter.
+
+        :param key: The string to add
+        :return: True if the string was not in the filter before, otherwise False
+        """
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        is_new = False
+        for index in range(self.hash_count):
+            bit = (first + index * second) % self.size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                is_new = True
+        return is_new
 
 
 def hierarchy_pos(graph, root=None, width=1.0, vert_gap=0.2, vert_loc=0, xcenter=0.5):
@@ -0,0 +1,196 @@
+"""This file contains a pool of Youtube Data API clients that spreads the calls of one
+process over several API keys.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import googleapiclient.discovery
+from googleapiclient.errors import HttpError
+from quota import QuotaLedger, quota_day, quota_ledger
+from ratelimit import LIST_COST, SEARCH_COST
+
+logger = logging.getLogger(__name__)
+
+
+DAILY_QUOTA = 10000
+
+
+class QuotaExhaustedError(RuntimeError):
+    """Raised when the quota of every API key in a pool has been exceeded."""
+
+
+def is_quota_exceeded(error: HttpError) -> bool:
+    """
+    Checks whether an HttpError was caused by an exceeded quota.
+
+    :param error: The error raised by a Youtube Data API request
+    :return: True if the quota of the API key has been exceeded, otherwise False
+    """
+    content = error.content.decode("utf-8", "replace") if error.content else ""
+    return error.resp.status == 403 and "quotaExceeded" in content
+
+
+class KeyPool:  # pylint: disable=too-many-instance-attributes
+    """
+    Holds one Youtube Data API object per API key and can be used in place of a single
+    API object. Every request is sent with the key that has the most quota left, and a
+    request that fails because the quota of its key has been exceeded is retried with the
+    next key, until every key is exhausted.
+
+    The spent quota units are recorded in the quota ledger, so that the quota spent by
+    earlier runs on the same day is taken into account. An optional budget limits the
+    quota units the pool may spend in total.
+    """
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        daily_quota: int = DAILY_QUOTA,
+        budget: Optional[int] = None,
+        ledger: QuotaLedger = quota_ledger,
+    ) -> None:
+        self.daily_quota = daily_quota
+        self.budget = budget
+        self.ledger = ledger
+        self.clients = {
+            api_key: googleapiclient.discovery.build("youtube", "v3", developerKey=api_key)
+            for api_key in api_keys
+        }
+        self.day = quota_day()
+        self.spent: Dict[str, int] = {
+            api_key: ledger.spent(api_key, self.day) for api_key in api_keys
+        }
+        self.spent_in_run = 0
+        self.exhausted: set = set()
+        self._lock = threading.Lock()
+
+    def _start_new_day(self) -> None:
+        """Resets the spent quota of every key once the quota day has changed."""
+        day = quota_day()
+        if day != self.day:
+            logger.info("A new quota day has started, the quota of every API key was reset")
+            self.day = day
+            self.spent = dict.fromkeys(self.clients, 0)
+            self.exhausted.clear()
+
+    def remaining(self, api_key: str) -> int:
+        """
+        Returns the number of quota units an API key has left.
+
+        :param api_key: The API key
+        :return: The remaining quota units of the key
+        """
+        if api_key in self.exhausted:
+            return 0
+        return max(self.daily_quota - self.spent[api_key], 0)
+
+    def available(self) -> int:
+        """
+        Returns the number of quota units the pool may still spend.
+
+        :return: The remaining quota units of all keys, limited by the budget
+        """
+        with self._lock:
+            self._start_new_day()
+            available = sum(self.remaining(api_key) for api_key in self.clients)
+        if self.budget is not None:
+            available = min(available, max(self.budget - self.spent_in_run, 0))
+        return available
+
+    def can_afford(self, cost: int) -> bool:
+        """
+        Checks whether the pool has enough quota left for a number of quota units.
+
+        :param cost: The quota units needed, e.g. the estimated cost of one tree
+        :return: True if the units are available, otherwise False
+        """
+        return self.available() >= cost
+
+    def _reserve(self, cost: int) -> str:
+        """Picks the key with the most quota left and charges the cost of a request to it."""
+        with self._lock:
+            self._start_new_day()
+            if self.budget is not None and self.spent_in_run + cost > self.budget:
+                raise QuotaExhaustedError(f"The budget of {self.budget} quota units is spent")
+            available = [api_key for api_key in self.clients if self.remaining(api_key) >= cost]
+            if not available:
+                raise QuotaExhaustedError("The quota of every API key has been exceeded")
+            api_key = max(available, key=self.remaining)
+            self.spent[api_key] += cost
+            self.spent_in_run += cost
+        self.ledger.record(api_key, cost, self.day)
+        return api_key
+
+    def execute(
+        self, resource: str, method: str, kwargs: Dict, cost: int, http: Optional[Any] = None
+    ) -> Dict:
+        """
+        Sends a request with the key that has the most quota left, failing over to the
+        remaining keys if the quota of a key has been exceeded.
+
+        :param resource: The name of the API resource, e.g. "search"
+        :param method: The name of the method of the resource, e.g. "list"
+        :param kwargs: The parameters of the request
+        :param cost: The cost of the request in quota units
+        :param http: An optional HTTP connection to send the request with
+        :return: The response of the request
+        """
+        while True:
+            api_key = self._reserve(cost)
+            request = getattr(getattr(self.clients[api_key], resource)(), method)(**kwargs)
+            try:
+                return request.execute(http=http) if http is not None else request.execute()
+            except HttpError as error:
+                if not is_quota_exceeded(error):
+                    raise
+                with self._lock:
+                    self.exhausted.add(api_key)
+                    unknown_spent = max(self.daily_quota - self.spent[api_key], 0)
+                    self.spent[api_key] += unknown_spent
+                self.ledger.record(api_key, unknown_spent, self.day)
+                logger.warning(
+                    "Quota of API key %s exceeded, %d key(s) left",
+                    api_key,
+                    len(self.clients) - len(self.exhausted),
+                )
+
+    def search(self) -> "_PooledResource":
+        """Returns the search resource of the pool."""
+        return _PooledResource(self, "search", SEARCH_COST)
+
+    def videos(self) -> "_PooledResource":
+        """Returns the videos resource of the pool."""
+        return _PooledResource(self, "videos", LIST_COST)
+
+    def channels(self) -> "_PooledResource":
+        """Returns the channels resource of the pool."""
+        return _PooledResource(self, "channels", LIST_COST)
+
+
+class _PooledResource:  # pylint: disable=too-few-public-methods
+    """An API resource whose requests are sent through a KeyPool."""
+
+    def __init__(self, pool: KeyPool, resource: str, cost: int) -> None:
+        self.pool = pool
+        self.resource = resource
+        self.cost = cost
+
+    def list(self, **kwargs) -> "_PooledRequest":
+        """Builds a list request that is sent once it is executed."""
+        return _PooledRequest(self.pool, self.resource, kwargs, self.cost)
+
+
+class _PooledRequest:  # pylint: disable=too-few-public-methods
+    """A request that picks its API key only when it is executed."""
+
+    def __init__(self, pool: KeyPool, resource: str, kwargs: Dict, cost: int) -> None:
+        self.pool = pool
+        self.resource = resource
+        self.kwargs = kwargs
+        self.cost = cost
+
+    def execute(self, http: Optional[Any] = None) -> Dict:
+        """Sends the request through the pool."""
+        return self.pool.execute(self.resource, "list", self.kwargs, self.cost, http)
@@ -2,24 +2,53 @@
 create tree and graph structures of related videos.
 """
 
+import csv
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import os
+import queue
 import re
-import subprocess
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import matplotlib.pyplot as plt
 import networkx as nx
+from accumulator import GraphAccumulator
+from cache import channel_name_cache
+from checkpoint import checkpoint_path, restore_checkpoint, write_checkpoint
+from crawler import Crawler, VisitedVideos
 from helpers import (
+    NOT_FOUND,
+    BloomFilter,
+    LayerIndex,
+    LayerTree,
+    channel_name_resolver,
+    get_channel_names,
     get_colors,
     get_layers,
     get_tree,
     hierarchy_pos,
+    prefetch_video_infos,
     save_layers,
     video_id_to_channel_id_dict,
     video_id_to_channel_name_dict,
     video_id_to_title_dict,
 )
+from keypool import HttpError, KeyPool, QuotaExhaustedError
+from logstore import (
+    LogWriter,
+    count_lines,
+    is_normalized,
+    iter_layers,
+    lines_end,
+    read_layers_at,
+    video_table,
+)
+from quota import log_force_plan
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +57,9 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(CURRENT_DIR, "data")
 GRAPHS_PATH = os.path.join(CURRENT_DIR, "graphs")
 TITLES_PATH = os.path.join(CURRENT_DIR, "titles")
+MAX_IN_FLIGHT_PER_KEY = 4
+GRAPH_STATE_VERSION = 1
+GRAPH_STATE_TAIL = 4096
 
 
 def _draw_tree(tree: nx.Graph, root: str, colors: List[str], labels: Dict, title: str) -> None:
@@ -41,51 +73,14 @@ def _draw_tree(tree: nx.Graph, root: str, colors: List[str], labels: Dict, title
 
 
 def _convert_to_graph(
-    tree: nx.Graph,
+    tree: Union[nx.Graph, LayerTree],
     root: str,
     video_id_to_channel_name: Dict,
-    graph: Optional[nx.Graph] = None,
-    log_line: Optional[int] = 0,
 ) -> nx.Graph:
     """Helper function to convert the tree into a network graph."""
-    graph = graph or nx.Graph()
-
-    for edge in tree.edges():
-        u_video_id, v_video_id = edge
-        u_channel_name = video_id_to_channel_name[u_video_id]
-        v_channel_name = video_id_to_channel_name[v_video_id]
-        if (
-            v_channel_name not in graph.nodes()
-            and u_channel_name == "Not Found"
-            and v_channel_name != "Not Found"
-        ):
-            graph.add_node(v_channel_name, size=1)
-            continue
-        if (
-            u_channel_name not in graph.nodes()
-            and v_channel_name == "Not Found"
-            and u_channel_name != "Not Found"
-        ):
-            graph.add_node(u_channel_name, size=1)
-            continue
-        if (
-            u_channel_name,
-            v_channel_name,
-        ) not in graph.edges() and u_channel_name != v_channel_name:
-            graph.add_edge(u_channel_name, v_channel_name, weight=1)
-        elif (u_channel_name, v_channel_name) in graph.edges():
-            graph.edges[u_channel_name, v_channel_name]["weight"] += 1
-
-    for node in tree.nodes():
-        u_channel_name = video_id_to_channel_name[node]
-        if u_channel_name == "Not Found":
-            continue
-        if log_line == 0 or (log_line > 0 and node != root):
-            current_size = graph.nodes[u_channel_name].get("size", 1)
-            current_size += 0.1
-            nx.set_node_attributes(graph, {u_channel_name: current_size}, "size")
-
-    return graph
+    accumulator = GraphAccumulator()
+    accumulator.add_subtree(tree, root, video_id_to_channel_name)
+    return accumulator.to_graph()
 
 
 def _save_graph(graph: nx.Graph, channel_name: str) -> None:
@@ -103,6 +98,8 @@ def draw_tree(
     depth: int,
     display: str,
     convert_graph: bool,
+    normalized: bool = False,
+    compressed: bool = False,
 ) -> None:
     """
     Takes the tree retrieved from get_tree, visualizes it, and optionally converts it to
@@ -112,22 +109,25 @@ def draw_tree(
     :param display: The type of display ('videoId', 'title', 'channelId', 'channelName')
     :param convert_graph: If True, converts the tree to a graph and saves it as a
         GraphML file
+    :param normalized: If True, the logfile is stored in the normalized format
+    :param compressed: If True, the logfile is stored as compressed frames
     :return: None
     """
     layers = get_layers(youtube, video_id, width, depth)
-    save_layers(layers, video_id)
-    tree, root = get_tree(layers)
-    colors = get_colors(layers, tree)
+    save_layers(layers, video_id, normalized, compressed)
+    index = LayerIndex(layers)
+    tree, root = get_tree(index)
+    colors = get_colors(index, tree)
 
     labels = {}
     if display == "videoId":
         labels = {node: node for node in tree.nodes()}
     elif display == "title":
-        labels = video_id_to_title_dict(layers, tree)
+        labels = video_id_to_title_dict(index, tree)
     elif display == "channelId":
-        labels = video_id_to_channel_id_dict(layers, tree)
+        labels = video_id_to_channel_id_dict(index, tree)
     elif display == "channelName":
-        labels = video_id_to_channel_name_dict(layers, tree, use_noembed=True)
+        labels = video_id_to_channel_name_dict(index, tree, use_noembed=True)
     _draw_tree(
         tree,
         root,
@@ -137,64 +137,319 @@ def draw_tree(
     )
 
     if convert_graph:
-        video_id_to_channel_name = video_id_to_channel_name_dict(layers, tree)
+        video_id_to_channel_name = video_id_to_channel_name_dict(index, tree)
         graph = _convert_to_graph(tree, root, video_id_to_channel_name)
         root_channel_name = video_id_to_channel_name[root]
         _save_graph(graph, root_channel_name)
 
 
-def _layers_list_from_logfile(logpath: str) -> List[Dict]:
-    """Reads the logfile and returns a list of layers."""
-    layers_list = []
-    with open(logpath, "r", encoding="utf-8") as logfile:
-        for line in logfile:
-            layers = eval(line)  # pylint: disable=eval-used
-            layers_list.append(layers)
-    return layers_list
+def _collect_channels(logpath: str, start: int = 0) -> Dict:
+    """First pass of convert_imports: maps every channel in the logfile (from line start
+    on) to one of its videos.
+    """
+    channel_id_to_video_id = {}
+    for layers in iter_layers(logpath, start):
+        for channel_id, video_id in LayerIndex(layers).channels.items():
+            channel_id_to_video_id.setdefault(channel_id, video_id)
+    return channel_id_to_video_id
+
+
+def _resolve_channels(youtube: Any, channel_id_to_video_id: Dict) -> Dict:
+    """Second pass of convert_imports: resolves the name of every channel exactly once,
+    using batched Youtube Data API calls if an API object is available and oembed or
+    noembed otherwise, or if the API calls fail (e.g. because no quota is left). Channels
+    whose lookup failed for a transient reason are left out.
+    """
+    channel_id_to_channel_name = channel_name_cache.lookup(channel_id_to_video_id.keys())
+    missing = {
+        channel_id: video_id
+        for channel_id, video_id in channel_id_to_video_id.items()
+        if channel_id not in channel_id_to_channel_name
+    }
+    logger.info("Resolving %d channels (%d cached)", len(missing), len(channel_id_to_channel_name))
+
+    if youtube is not None:
+        try:
+            channel_id_to_channel_name.update(get_channel_names(youtube, list(missing)))
+        except (QuotaExhaustedError, HttpError) as error:
+            # The batches resolved before the error are already in the cache
+            channel_id_to_channel_name.update(channel_name_cache.lookup(missing.keys()))
+            logger.warning("Could not resolve every channel with the API: %s", error)
+        missing = {
+            channel_id: video_id
+            for channel_id, video_id in missing.items()
+            if channel_id not in channel_id_to_channel_name
+        }
+
+    if missing:
+        channel_id_to_channel_name.update(channel_name_resolver.resolve(missing, use_noembed=True))
+    return channel_id_to_channel_name
+
+
+def _convert_shard(
+    logpath: str,
+    start: int,
+    stop: int,
+    channel_id_to_channel_name: Optional[Dict],
+    partial: bool,
+) -> Tuple[GraphAccumulator, Optional[str]]:
+    """
+    Folds the subtrees of the lines start to stop of a logfile into an accumulator.
+
+    :param logpath: The name of the logfile containing the layers
+    :param start: The number of the first line of the shard
+    :param stop: The number of the line after the last line of the shard
+    :param channel_id_to_channel_name: The channel names resolved in the first pass (if
+        None, the channels are keyed by their channel IDs instead)
+    :param partial: If True, the accumulator records its insertions so that it can be
+        merged into the accumulator of the previous shards
+    :return: A tuple containing the accumulator and the channel name (or channel ID) of
+        the root of the first subtree in the shard
+    """
+    by_channel_id = channel_id_to_channel_name is None
+    accumulator = GraphAccumulator(not_found=None if by_channel_id else NOT_FOUND, partial=partial)
+    first_root_channel_name = None
+
+    for log_line, layers in enumerate(iter_layers(logpath, start, stop), start):
+        index = LayerIndex(layers)
+        subtree = LayerTree(index)
+        subroot = subtree.root
+        video_id_to_channel_id = index.channel
+        if by_channel_id:
+            video_id_to_channel_name = {
+                node: video_id_to_channel_id[node] for node in subtree.nodes()
+            }
+        else:
+            video_id_to_channel_name = {
+                node: channel_id_to_channel_name.get(video_id_to_channel_id[node]) or NOT_FOUND
+                for node in subtree.nodes()
+            }
+        subroot_channel_name = video_id_to_channel_name[subroot]
+        first_root_channel_name = first_root_channel_name or subroot_channel_name
+
+        logger.info("Converting subtree: %d with root: %s", log_line, subroot_channel_name)
+        accumulator.add_subtree(
+            subtree, subroot, video_id_to_channel_name, count_root=log_line == 0
+        )
+
+    return accumulator, first_root_channel_name
+
+
+def _graph_state_path(logpath: str, by_channel_id: bool) -> str:
+    """Returns the path of the graph state that belongs to a logfile."""
+    suffix = ".channel_ids.graphstate" if by_channel_id else ".graphstate"
+    return os.path.splitext(logpath)[0] + suffix
 
 
-def convert_imports(logpath: str) -> None:
+def _tail_digest(logpath: str, offset: int) -> str:
+    """Returns a hash of the bytes before an offset, which identifies the logfile contents
+    a graph state was built from.
+    """
+    with open(logpath, "rb") as logfile:
+        start = max(offset - GRAPH_STATE_TAIL, 0)
+        logfile.seek(start)
+        return hashlib.sha256(logfile.read(offset - start)).hexdigest()
+
+
+def _save_graph_state(
+    logpath: str,
+    accumulator: GraphAccumulator,
+    line_count: int,
+    file_name: Optional[str],
+    channel_id_to_video_id: Optional[Dict] = None,
+) -> None:
+    """Saves the accumulated graph together with the number of converted lines and the
+    byte offset where they end, replacing the previous graph state atomically. Graphs
+    keyed by channel ID also keep a video of every channel for the final labelling.
+    """
+    offset = lines_end(logpath, line_count)
+    state = {
+        "version": GRAPH_STATE_VERSION,
+        "log_lines": line_count,
+        "log_offset": offset,
+        "tail_digest": _tail_digest(logpath, offset),
+        "file_name": file_name,
+        "graph": accumulator.to_dict(),
+    }
+    if channel_id_to_video_id is not None:
+        state["channel_videos"] = channel_id_to_video_id
+    path = _graph_state_path(logpath, channel_id_to_video_id is not None)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(state, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+
+
+def _load_graph_state(logpath: str, by_channel_id: bool) -> Optional[Dict]:
+    """Loads the graph state of a logfile, or returns None if there is none or if the
+    converted lines of the logfile have changed since it was saved.
+    """
+    path = _graph_state_path(logpath, by_channel_id)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        state = json.load(file)
+
+    line_count, offset = state["log_lines"], state["log_offset"]
+    if (
+        state.get("version") != GRAPH_STATE_VERSION
+        or count_lines(logpath) < line_count
+        or lines_end(logpath, line_count) != offset
+        or _tail_digest(logpath, offset) != state["tail_digest"]
+    ):
+        logger.info("Graph state does not match the logfile, converting every subtree")
+        return None
+    return state
+
+
+def _convert_partials(
+    logpath: str, start: int, stop: int, channel_id_to_channel_name: Dict, jobs: int
+) -> List[Tuple[GraphAccumulator, Optional[str]]]:
+    """Converts the lines start to stop of a logfile into partial accumulators, using
+    parallel processes if jobs is greater than one.
+    """
+    if jobs <= 1:
+        return [_convert_shard(logpath, start, stop, channel_id_to_channel_name, partial=True)]
+
+    shard_size = max(-(-(stop - start) // jobs), 1)
+    starts = range(start, stop, shard_size)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(
+            executor.map(
+                _convert_shard,
+                itertools.repeat(logpath),
+                starts,
+                [min(shard_start + shard_size, stop) for shard_start in starts],
+                itertools.repeat(channel_id_to_channel_name),
+                itertools.repeat(True),
+            )
+        )
+
+
+def _accumulate(
+    logpath: str,
+    state: Optional[Dict],
+    line_count: int,
+    channel_id_to_channel_name: Optional[Dict],
+    jobs: int,
+) -> Tuple[GraphAccumulator, Optional[str]]:
+    """Folds the lines of a logfile that are not part of the graph state yet into the
+    accumulated graph.
+    """
+    if state is None and jobs <= 1:
+        return _convert_shard(logpath, 0, line_count, channel_id_to_channel_name, partial=False)
+
+    if state is not None:
+        logger.info("Loaded graph state of %d subtrees", state["log_lines"])
+        accumulator, file_name = GraphAccumulator.from_dict(state["graph"]), state["file_name"]
+    else:
+        not_found = NOT_FOUND if channel_id_to_channel_name is not None else None
+        accumulator, file_name = GraphAccumulator(not_found=not_found), None
+    start = state["log_lines"] if state else 0
+    for partial, first_root_channel_name in _convert_partials(
+        logpath, start, line_count, channel_id_to_channel_name, jobs
+    ):
+        accumulator.merge(partial)
+        file_name = file_name or first_root_channel_name
+    return accumulator, file_name
+
+
+def _label_channels(
+    youtube: Any, graph: nx.Graph, channel_id_to_video_id: Dict, root_channel_id: Optional[str]
+) -> Optional[str]:
+    """Resolves the names of all channels of a graph keyed by channel ID in one batch and
+    attaches them as labels. Returns the name of the root channel.
+    """
+    channel_id_to_channel_name = _resolve_channels(
+        youtube, {channel_id: channel_id_to_video_id[channel_id] for channel_id in graph.nodes()}
+    )
+    nx.set_node_attributes(
+        graph,
+        {
+            channel_id: channel_id_to_channel_name.get(channel_id) or NOT_FOUND
+            for channel_id in graph.nodes()
+        },
+        "label",
+    )
+    return channel_id_to_channel_name.get(root_channel_id) or root_channel_id
+
+
+def convert_imports(
+    logpath: str,
+    youtube: Any = None,
+    jobs: int = 1,
+    incremental: bool = True,
+    by_channel_id: bool = False,
+) -> None:
     """
     Given the path to a logfile that contains multiple tree-representing layers,
     converts this set of layers into one network graph that will be saved in the graphs
-    folder.
+    folder. The logfile is read in two passes: the first one collects every channel and
+    resolves its name once, the second one streams the logfile again and folds every
+    subtree into the graph without any network I/O. The second pass can be split into
+    line ranges that are converted in parallel processes and merged afterwards, which
+    results in exactly the same graph.
+
+    If by_channel_id is True, the nodes of the graph are channel IDs instead of channel
+    names. The graph is then built without resolving any channel names first, and the
+    names are attached as labels in one batch at the end. Channels whose name cannot be
+    resolved keep their own node instead of being merged into the "Not Found" node.
+
+    The accumulated graph is saved as a graph state next to the logfile. If a matching
+    graph state exists, only the lines that were appended since it was saved are read
+    and folded into it.
 
     :param logpath: The name of the logfile containing the layers
+    :param youtube: The Youtube Data API object used to resolve channel names in batches
+        (if not provided, oembed and noembed will be used instead)
+    :param jobs: The number of processes used to convert the subtrees
+    :param incremental: If False, the graph state is ignored and every subtree is
+        converted again
+    :param by_channel_id: If True, the graph is keyed by channel ID and labelled with
+        the channel names
     :return: None
     """
-    file_name, use_noembed = None, True
-    graph = nx.Graph()
-    layers_list = _layers_list_from_logfile(logpath)
-
-    for log_line, layers in enumerate(layers_list):
-        subtree, subroot = get_tree(layers)
-        use_noembed = not use_noembed if log_line % 20 == 0 and log_line > 0 else use_noembed
-        video_id_to_channel_name = video_id_to_channel_name_dict(
-            layers, subtree, use_noembed=use_noembed
-        )
-        subroot_channel_name = video_id_to_channel_name[subroot]
-        file_name = subroot_channel_name if file_name is None else file_name
+    state = _load_graph_state(logpath, by_channel_id) if incremental else None
+    start = state["log_lines"] if state else 0
+    line_count = count_lines(logpath)
+    channel_id_to_video_id = _collect_channels(logpath, start)
+
+    if by_channel_id:
+        channel_id_to_channel_name = None
+        channel_videos = dict(state["channel_videos"]) if state else {}
+        for channel_id, video_id in channel_id_to_video_id.items():
+            channel_videos.setdefault(channel_id, video_id)
+    else:
+        channel_id_to_channel_name = _resolve_channels(youtube, channel_id_to_video_id)
+        channel_videos = None
 
-        logger.info("Converting subtree: %d with root: %s", log_line, subroot_channel_name)
-        graph = _convert_to_graph(
-            subtree,
-            subroot,
-            video_id_to_channel_name,
-            graph=graph,
-            log_line=log_line,
+    accumulator, file_name = _accumulate(
+        logpath, state, line_count, channel_id_to_channel_name, jobs
+    )
+    unresolved = (
+        0 if by_channel_id else len(channel_id_to_video_id) - len(channel_id_to_channel_name)
+    )
+    if unresolved:
+        # The labels of these channels are only valid for this run, so they must not be
+        # baked into the graph state
+        logger.warning(
+            "Not saving the graph state, %d channel names could not be looked up", unresolved
         )
+    else:
+        _save_graph_state(logpath, accumulator, line_count, file_name, channel_videos)
 
+    graph = accumulator.to_graph()
+    if by_channel_id:
+        file_name = _label_channels(youtube, graph, channel_videos, file_name)
     logger.info(
-        "Converted %d subtrees into a network graph with %d nodes and %d edges",
-        len(layers_list),
+        "Converted %d new subtrees into a network graph with %d nodes and %d edges",
+        line_count - start,
         len(graph.nodes()),
         len(graph.edges()),
     )
     _save_graph(graph, file_name)
 
 
-def _save_breakpoint(
-    video_id: str,
+def _breakpoint_state(
     start_line: int,
     leaf_index: int,
     current_leafs: int,
@@ -202,20 +457,29 @@ def _save_breakpoint(
     current_depth: int,
     leaf_layer_video_ids: List[str],
     evaluating_root: bool,
-) -> None:
+    depth: int,
+) -> List[int]:
+    """
+    Returns the state from which the calculation continues at a leaf of a line. The
+    leaf count and depth are rolled back to their values before the line was read, since
+    they are updated again once the line is read on continuation.
+    """
+    if evaluating_root:
+        return [start_line, leaf_index, 0, next_leafs, current_depth - depth]
+    return [
+        start_line,
+        leaf_index,
+        current_leafs,
+        next_leafs - len(leaf_layer_video_ids),
+        current_depth,
+    ]
+
+
+def _save_breakpoint(writer: LogWriter, state: List[int]) -> None:
     """Saves the current state of the calculation to a breakpoint file."""
-    with open(f"{DATA_PATH}/{video_id}.breakpoint", "w", encoding="utf-8") as file:
-        file.write(str(start_line) + "\n")
-        file.write(str(leaf_index) + "\n")
-        if evaluating_root:
-            file.write(str(0) + "\n")
-            file.write(str(next_leafs) + "\n")
-        else:
-            file.write(str(current_leafs) + "\n")
-            file.write(str(next_leafs - len(leaf_layer_video_ids)) + "\n")
-        file.write(str(current_depth))
-    logger.info("Saved logfile: %s/%s.log", DATA_PATH, video_id)
-    logger.info("Saved breakpoint: %s/%s.breakpoint", DATA_PATH, video_id)
+    write_checkpoint(writer, state)
+    logger.info("Saved logfile: %s", writer.logpath)
+    logger.info("Saved breakpoint: %s", checkpoint_path(writer.logpath))
 
 
 def _calc_leaf_trees(
@@ -224,9 +488,7 @@ def _calc_leaf_trees(
     current_leafs: int,
     next_leafs: int,
     current_depth: int,
-    youtube: Any,
-    width: int,
-    depth: int,
+    crawler: Crawler,
     max_depth: int,
     video_id: str,
 ) -> Tuple[bool, int, int]:
@@ -239,9 +501,7 @@ def _calc_leaf_trees(
     :param current_leafs: The number of leaf nodes left in the current layer
     :param next_leafs: The number of leaf nodes in the next layer
     :param current_depth: The current overall depth of the tree
-    :param youtube: The Youtube Data API object
-    :param width: The width of one tree (number of related videos per layer)
-    :param depth: The depth of one tree (number of layers)
+    :param crawler: The crawler used to expand the leaf nodes
     :param max_depth: The maximum overall depth that should not be exceeded
     :param video_id: The ID of the Youtube video for which the layers should be
         calculated
@@ -250,41 +510,47 @@ def _calc_leaf_trees(
         evaluated
     """
     evaluating_root = False
-    with open(f"{DATA_PATH}/{video_id}.log", "r", encoding="utf-8") as logfile:
-        for line_number, line in enumerate(logfile):
-            if line_number == start_line:
-                start_layers = eval(line)  # pylint: disable=eval-used
-                leaf_layer = start_layers[-1]
-                leaf_layer_video_ids = list(leaf_layer.keys())
-                if current_leafs == 0:
-                    current_leafs = len(leaf_layer_video_ids) + 1
-                    evaluating_root = True
-                else:
-                    next_leafs += len(leaf_layer_video_ids)
+    logpath = f"{DATA_PATH}/{video_id}.log"
+    start_layers = read_layers_at(logpath, start_line)
+    leaf_layer = start_layers[-1]
+    leaf_layer_video_ids = list(leaf_layer.keys())
+    if current_leafs == 0:
+        current_leafs = len(leaf_layer_video_ids) + 1
+        evaluating_root = True
+    else:
+        next_leafs += len(leaf_layer_video_ids)
+    line_state = functools.partial(
+        _breakpoint_state,
+        start_line,
+        current_leafs=current_leafs,
+        next_leafs=next_leafs,
+        current_depth=current_depth,
+        leaf_layer_video_ids=leaf_layer_video_ids,
+        evaluating_root=evaluating_root,
+        depth=crawler.depth,
+    )
 
-    with open(f"{DATA_PATH}/{video_id}.log", "a", encoding="utf-8") as logfile:
+    with LogWriter(logpath) as writer:
+        if current_depth < max_depth:
+            prefetch_video_infos(crawler.youtube, leaf_layer_video_ids[current_leaf_index:])
         for leaf_index, leaf_video_id in enumerate(leaf_layer_video_ids):
             if leaf_index >= current_leaf_index:
                 try:
                     if current_depth >= max_depth:
                         raise ValueError("Max depth has been reached")
-                    layers = get_layers(youtube, leaf_video_id, width, depth)
-                    print(layers, file=logfile)
-                    logger.info("Saved leaftree: %d", leaf_index)
-                except Exception:  # pylint: disable=broad-except
-                    _save_breakpoint(
-                        video_id,
-                        start_line,
-                        leaf_index,
-                        current_leafs,
-                        next_leafs,
-                        current_depth,
-                        leaf_layer_video_ids,
-                        evaluating_root,
-                    )
+                    if not crawler.can_afford_tree():
+                        raise QuotaExhaustedError("Not enough quota left for another tree")
+                    layers = crawler.get_layers(leaf_video_id)
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.info("Stopping tree calculation: %s", error)
+                    _save_breakpoint(writer, line_state(leaf_index))
                     continue_eval = False
                     return continue_eval, current_leafs, next_leafs
 
+                writer.append(layers)
+                write_checkpoint(writer, line_state(leaf_index + 1))
+                logger.info("Saved leaftree: %d", leaf_index)
+
     continue_eval = True
     return continue_eval, current_leafs, next_leafs
 
@@ -318,6 +584,7 @@ def _force_until_quota(
         calculated
     :return: None
     """
+    crawler = Crawler(youtube, width, depth)
     continue_eval = True
     while continue_eval:
         logger.info("Calculating leaf trees on line: %d", start_line)
@@ -336,9 +603,7 @@ def _force_until_quota(
             current_leafs,
             next_leafs,
             current_depth,
-            youtube,
-            width,
-            depth,
+            crawler,
             max_depth,
             video_id,
         )
@@ -346,11 +611,25 @@ def _force_until_quota(
         current_leaf_index = 0
         current_leafs -= 1
 
+    crawler.log_stats()
+
 
-def _calc_new_tree(youtube: Any, video_id: str, width: int, depth: int, max_depth: int) -> None:
+def _calc_new_tree(
+    youtube: Any,
+    video_id: str,
+    width: int,
+    depth: int,
+    max_depth: int,
+    normalized: bool,
+    compressed: bool,
+) -> None:
     """Helper to calculate a new tree from scratch."""
     layers = get_layers(youtube, video_id, width, depth)
-    save_layers(layers, video_id)
+    with LogWriter(
+        f"{DATA_PATH}/{video_id}.log", truncate=True, normalized=normalized, compressed=compressed
+    ) as writer:
+        writer.append(layers)
+        write_checkpoint(writer, [0, 0, 0, 0, 0])
     _force_until_quota(
         start_line=0,
         current_leaf_index=0,
@@ -368,12 +647,10 @@ def _calc_new_tree(youtube: Any, video_id: str, width: int, depth: int, max_dept
 def _read_breakpoint(
     video_id: str,
 ) -> List[int]:
-    """Helper to read the breakpoint file and return the saved state."""
-    breakpoint_info = [0, 0, 0, 0, 0]
-    with open(f"{DATA_PATH}/{video_id}.breakpoint", "r", encoding="utf-8") as file:
-        for line_index, line in enumerate(file):
-            breakpoint_info[line_index] = int(line.strip())
-    return breakpoint_info
+    """Helper to read the breakpoint file, trim the logfile to the last tree covered by
+    it and return the saved state.
+    """
+    return restore_checkpoint(f"{DATA_PATH}/{video_id}.log")
 
 
 def _continue_tree_calc(
@@ -405,6 +682,8 @@ def force_until_quota(
     width: int,
     depth: int,
     max_depth: int,
+    normalized: bool = False,
+    compressed: bool = False,
 ) -> None:
     """
     Calculates the layers of related videos until the API usage limit has been exceeded
@@ -419,79 +698,301 @@ def force_until_quota(
     :param width: The width of one tree (number of related videos per layer)
     :param depth: The depth of one tree (number of layers)
     :param max_depth: The maximum overall depth that should not be exceeded
+    :param normalized: If True, a new logfile is stored in the normalized format
+    :param compressed: If True, a new logfile is stored as compressed frames
     :return: None
     """
+    if isinstance(youtube, KeyPool):
+        log_force_plan(width, depth, max_depth, youtube.available())
     if not os.path.isfile(f"{DATA_PATH}/{video_id}.log"):
         logger.info("Starting tree calculation...")
-        _calc_new_tree(youtube, video_id, width, depth, max_depth)
+        _calc_new_tree(youtube, video_id, width, depth, max_depth, normalized, compressed)
     elif not os.path.isfile(f"{DATA_PATH}/{video_id}.breakpoint"):
         logger.info("Log file exists, but no breakpoint file found. Starting from scratch...")
-        _calc_new_tree(youtube, video_id, width, depth, max_depth)
+        _calc_new_tree(youtube, video_id, width, depth, max_depth, normalized, compressed)
     else:
         logger.info("Log file and breakpoint file found. Continuing tree calculation...")
         _continue_tree_calc(youtube, video_id, width, depth, max_depth)
 
 
+def _crawl_worker(
+    worker_index: int, crawler: Crawler, tasks: queue.Queue, results: queue.Queue
+) -> None:
+    """
+    Expands leaves from the shared task queue. If the quota left is not enough for
+    another tree or an expansion fails, the leaf is handed back to the queue for the
+    remaining workers and the worker stops.
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        sequence_number, leaf_video_id = task
+        try:
+            if not crawler.can_afford_tree():
+                raise QuotaExhaustedError("Not enough quota left for another tree")
+            layers = crawler.get_layers(leaf_video_id)
+        except Exception as error:  # pylint: disable=broad-except
+            tasks.put(task)
+            logger.info("Worker %d stopped: %s", worker_index, error)
+            results.put(("stopped", worker_index, None))
+            return
+        results.put(("layers", sequence_number, layers))
+
+
+class _AggressiveCrawl:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Schedules the leaves of a tree calculation over one worker thread per API key of a
+    key pool. Every leaf is handed to exactly one worker through a shared task queue, and
+    the finished trees are appended to the logfile in the same order as in
+    force_until_quota by a single writer, which saves a checkpoint after every tree.
+    """
+
+    def __init__(
+        self, youtube: KeyPool, video_id: str, width: int, depth: int, max_depth: int
+    ) -> None:
+        self.youtube = youtube
+        self.video_id = video_id
+        self.logpath = f"{DATA_PATH}/{video_id}.log"
+        self.depth = depth
+        self.max_depth = max_depth
+        self.stop_position: Optional[Tuple] = None
+        self.max_in_flight = MAX_IN_FLIGHT_PER_KEY * len(youtube.clients)
+        self.tasks: queue.Queue = queue.Queue()
+        self.results: queue.Queue = queue.Queue()
+        self.positions: Dict[int, Tuple] = {}
+        self.finished: Dict[int, List[Dict]] = {}
+        self.dispatched = 0
+        self.written = 0
+
+        visited = VisitedVideos()
+        self.crawlers = [Crawler(youtube, width, depth, visited) for _ in youtube.clients]
+        self.workers = [
+            threading.Thread(
+                target=_crawl_worker,
+                args=(worker_index, crawler, self.tasks, self.results),
+                daemon=True,
+            )
+            for worker_index, crawler in enumerate(self.crawlers)
+        ]
+        self.alive = len(self.workers)
+
+    def _in_flight(self) -> int:
+        """Returns the number of leaves that were dispatched but not returned yet."""
+        return self.dispatched - self.written - len(self.finished)
+
+    def _receive(self, writer: LogWriter) -> None:
+        """Waits for the next result of a worker and appends every tree that is next in
+        line to the logfile.
+        """
+        kind, key, layers = self.results.get()
+        if kind == "stopped":
+            self.alive -= 1
+            return
+
+        self.finished[key] = layers
+        while self.written in self.finished:
+            writer.append(self.finished.pop(self.written))
+            position = self.positions.pop(self.written)
+            write_checkpoint(writer, self._state(position, leaf_offset=1))
+            logger.info("Saved leaftree: %d", position[1])
+            self.written += 1
+
+    def _state(self, position: Tuple, leaf_offset: int = 0) -> List[int]:
+        """Returns the breakpoint state of a leaf position, or of the leaf after it."""
+        line, index, line_state = position
+        return _breakpoint_state(line, index + leaf_offset, *line_state, self.depth)
+
+    def _dispatch(self, line: int, leaf_index: int, line_state: Tuple, writer: LogWriter) -> bool:
+        """
+        Hands the leaves of one line to the workers, starting at leaf_index.
+
+        :return: False if the crawl has to stop at one of the leaves, otherwise True
+        """
+        leaf_layer_video_ids, current_depth = line_state[3], line_state[2]
+        if current_depth < self.max_depth:
+            prefetch_video_infos(self.youtube, leaf_layer_video_ids[leaf_index:])
+        for index in range(leaf_index, len(leaf_layer_video_ids)):
+            while self._in_flight() >= self.max_in_flight and self.alive:
+                self._receive(writer)
+            if current_depth >= self.max_depth or not self.alive:
+                self.stop_position = (line, index, line_state)
+                return False
+            self.positions[self.dispatched] = (line, index, line_state)
+            self.tasks.put((self.dispatched, leaf_layer_video_ids[index]))
+            self.dispatched += 1
+        return True
+
+    def run(self, state: List[int]) -> None:
+        """
+        Calculates leaf trees starting at the given breakpoint state until every API key
+        has been exhausted or max_depth has been reached.
+
+        :param state: The breakpoint state [start_line, current_leaf_index,
+            current_leafs, next_leafs, current_depth]
+        :return: None
+        """
+        line, leaf_index, current_leafs, next_leafs, current_depth = state
+        for worker in self.workers:
+            worker.start()
+
+        with LogWriter(self.logpath) as writer:
+            while True:
+                if current_leafs == 0:
+                    current_depth += self.depth
+                    current_leafs = next_leafs
+                    next_leafs = 0
+
+                while line >= writer.line_count and self._in_flight() and self.alive:
+                    self._receive(writer)
+                if line >= writer.line_count or not self.alive:
+                    break
+
+                logger.info("Calculating leaf trees on line: %d", line)
+                leaf_layer_video_ids = list(read_layers_at(self.logpath, line)[-1])
+                evaluating_root = current_leafs == 0
+                if evaluating_root:
+                    current_leafs = len(leaf_layer_video_ids) + 1
+                else:
+                    next_leafs += len(leaf_layer_video_ids)
+                line_state = (
+                    current_leafs,
+                    next_leafs,
+                    current_depth,
+                    leaf_layer_video_ids,
+                    evaluating_root,
+                )
+                if not self._dispatch(line, leaf_index, line_state, writer):
+                    break
+
+                line += 1
+                leaf_index = 0
+                current_leafs -= 1
+
+            while self._in_flight() and self.alive:
+                self._receive(writer)
+            self._save_stop_position(writer)
+
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        # The crawlers share one visited set, so the stats of any of them cover the run
+        self.crawlers[0].log_stats()
+
+    def _save_stop_position(self, writer: LogWriter) -> None:
+        """Saves a breakpoint at the first leaf whose tree has not been written yet."""
+        stop_position = self.stop_position
+        if self.written < self.dispatched:
+            stop_position = self.positions[self.written]
+        if stop_position is None:
+            logger.info("No leaves left to calculate")
+            return
+        _save_breakpoint(writer, self._state(stop_position))
+
+
 def calculate_aggressive(
     api_keys: list[str],
     seed: str,
     width: int,
     depth: int,
     max_depth: int,
+    budget: Optional[int] = None,
+    normalized: bool = False,
+    compressed: bool = False,
 ) -> None:
     """
     Calculates the layers of related videos for a given seed video using multiple API
     keys in an aggressive manner, meaning it will use all API keys in parallel until the
-    quota is exceeded or max_depth is reached. Each API key will be used to start a new
-    process that runs the main.py script with the specified parameters.
+    quota is exceeded or max_depth is reached. Every API key adds a worker thread, the
+    leaves of the tree are distributed between the workers without overlap, and the
+    requests of all workers are sent through one key pool, which moves on to the next
+    key whenever the quota of a key has been exceeded. The results are written to the
+    same logfile and breakpoint file as in force_until_quota.
 
     :param api_keys: A list of API keys to use for the calculation
     :param seed: The ID of the Youtube video to start with
     :param width: The width of one tree (number of related videos per layer)
     :param depth: The depth of one tree (number of layers)
     :param max_depth: The maximum overall depth that should not be exceeded
+    :param budget: The maximum number of quota units to spend (default: no limit)
+    :param normalized: If True, a new logfile is stored in the normalized format
+    :param compressed: If True, a new logfile is stored as compressed frames
     :return: None
     """
-    for api_key in api_keys:
-        logger.info("Using API-Key: %s", api_key)
-        force_process = subprocess.Popen(
-            [
-                "python",
-                "main.py",
-                f"-s {seed}",
-                f"-w {width}",
-                f"-d {depth}",
-                f"-m {max_depth}",
-                f"-a {api_key}",
-                "-f",
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        for line in iter(force_process.stdout.readline, b""):
-            logger.info("%s", line.rstrip().decode())
+    youtube = KeyPool(api_keys, budget=budget)
+    log_force_plan(width, depth, max_depth, youtube.available())
+    if os.path.isfile(f"{DATA_PATH}/{seed}.log") and os.path.isfile(
+        f"{DATA_PATH}/{seed}.breakpoint"
+    ):
+        logger.info("Log file and breakpoint file found. Continuing tree calculation...")
+        state = _read_breakpoint(seed)
+    else:
+        logger.info("Starting tree calculation...")
+        # The existing logfile is only replaced once the seed tree has been fetched
+        layers = get_layers(youtube, seed, width, depth)
+        with LogWriter(
+            f"{DATA_PATH}/{seed}.log", truncate=True, normalized=normalized, compressed=compressed
+        ) as writer:
+            writer.append(layers)
+            state = [0, 0, 0, 0, 0]
+            write_checkpoint(writer, state)
+
+    _AggressiveCrawl(youtube, seed, width, depth, max_depth).run(state)
+
+
+def _iter_unique_videos(logpath: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yields the video ID, title and channel ID of every video of a logfile once, in the
+    order in which the videos first appear. Normalized logfiles are read from their
+    video table. Other logfiles are streamed, and videos that were seen before are
+    detected with a Bloom filter, which is sized for the number of videos in the logfile.
+    """
+    line_count = count_lines(logpath)
+    if is_normalized(logpath):
+        for video_id, (title, channel_id, first_seen) in video_table(logpath).videos.items():
+            if first_seen < line_count:
+                yield video_id, title, channel_id
+        return
+
+    videos_per_line = sum(len(layer) for layer in read_layers_at(logpath, 0)) if line_count else 0
+    seen = BloomFilter(line_count * videos_per_line)
+    for layers in iter_layers(logpath):
+        for layer in layers:
+            for video_id, video_info in layer.items():
+                if seen.add(video_id):
+                    yield video_id, video_info[1], video_info[2]
 
 
-def get_titles(logpath: str) -> None:
+def get_titles(logpath: str, channels: bool = False) -> None:
     """
     Extracts the titles of every video from a specified logfile in the data folder and
-    saves them in the titles folder.
+    saves them in the titles folder. Every video is only written once, the first time it
+    appears.
 
     :param logpath: The path to the logfile containing the layers
+    :param channels: If True, a TSV file with the video ID, channel ID and title of every
+        video, grouped by channel, is saved next to the titles
     :return: None
     """
-    video_titles = []
-    layers_list = _layers_list_from_logfile(logpath)
-
-    for layers in layers_list:
-        for layer in layers:
-            for video_info in layer.values():
-                video_title = video_info[1]
-                video_titles.append(video_title)
+    channel_id_to_videos: Dict[str, List[Tuple[str, str]]] = {}
 
     filename = os.path.basename(logpath).replace(".log", ".titles")
+    title_count = 0
     with open(f"{TITLES_PATH}/{filename}", "w", encoding="utf-8") as title_file:
-        for video_title in video_titles:
-            title_file.write(video_title + "\n")
-
-    logger.info("Extracted titles: %s", f"{TITLES_PATH}/{filename}")
+        for video_id, title, channel_id in _iter_unique_videos(logpath):
+            title_file.write(title + "\n")
+            title_count += 1
+            if channels:
+                channel_id_to_videos.setdefault(channel_id, []).append((video_id, title))
+
+    logger.info("Extracted %d titles: %s", title_count, f"{TITLES_PATH}/{filename}")
+
+    if channels:
+        tsv_path = f"{TITLES_PATH}/{os.path.splitext(filename)[0]}.tsv"
+        with open(tsv_path, "w", encoding="utf-8", newline="") as tsv_file:
+            writer = csv.writer(tsv_file, delimiter="\t")
+            writer.writerow(["video_id", "channel_id", "title"])
+            for channel_id, videos in channel_id_to_videos.items():
+                writer.writerows((video_id, channel_id, title) for video_id, title in videos)
+        logger.info("Extracted titles grouped by channel: %s", tsv_path)
@@ -0,0 +1,706 @@
+"""This file contains the reader and writer for the logfiles in the data folder. Every
+line of a logfile holds the layers of one tree encoded as JSON. Next to every logfile, an
+index file stores the byte offset of each line, so that single lines can be read without
+scanning the logfile.
+
+Normalized logfiles store the title and channel ID of every video only once, in a video
+table next to the logfile, and their lines only map every video ID to the video ID it is
+related to. Both formats are read into the same layers.
+
+Compressed logfiles store every line as a zlib frame of its own, so that lines can still
+be appended and read on their own through the offset index. Once the logfile holds
+enough data, every frame is compressed with the beginning of the logfile as a preset
+dictionary, which is what most of the repetitions of a line refer to.
+"""
+
+import array
+import ast
+import glob
+import json
+import logging
+import os
+import sys
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from records import VideoRecord, compact_layer, compact_layers
+
+logger = logging.getLogger(__name__)
+
+
+LOG_DICTIONARY_SIZE = 32768
+COMPRESSION_LEVEL = 9
+READ_CHUNK_SIZE = 65536
+
+
+def _encode_record(video_info: Any) -> List[Optional[str]]:
+    """Encodes the records of the layers in their list form."""
+    if isinstance(video_info, VideoRecord):
+        return video_info.to_list()
+    raise TypeError(f"Object of type {type(video_info).__name__} is not JSON serializable")
+
+
+def dump_layers(layers: List[Dict]) -> str:
+    """
+    Encodes the layers of one tree as a single line of JSON. Videos are stored as lists
+    of [related_to, title, channel_id], whether the layers hold records or lists.
+
+    :param layers: The layers that were returned by get_layers
+    :return: The JSON encoded layers without a trailing newline
+    """
+    return json.dumps(layers, ensure_ascii=False, separators=(",", ":"), default=_encode_record)
+
+
+def dump_normalized(layers: List[Dict]) -> str:
+    """
+    Encodes the layers of one tree as a single line of a normalized logfile, which only
+    maps every video ID to the video ID it is related to.
+
+    :param layers: The layers that were returned by get_layers
+    :return: The JSON encoded layers without a trailing newline
+    """
+    return json.dumps(
+        [{video_id: video_info[0] for video_id, video_info in layer.items()} for layer in layers],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def parse_layers(line: str, videos: Optional["VideoTable"] = None) -> List[Dict]:
+    """
+    Decodes one line of a logfile into layers holding records. Lines written in the
+    legacy format (the Python repr of the layers) are still understood, but they are
+    parsed as literals instead of being evaluated.
+
+    :param line: The line of the logfile
+    :param videos: The video table, if the line belongs to a normalized logfile
+    :return: The layers stored in the line
+    """
+    if videos is not None:
+        return json.loads(line, object_pairs_hook=videos.expand_layer)
+    try:
+        return json.loads(line, object_pairs_hook=compact_layer)
+    except ValueError:
+        return compact_layers(ast.literal_eval(line))
+
+
+def index_path(logpath: str) -> str:
+    """Returns the path of the offset index that belongs to a logfile."""
+    return os.path.splitext(logpath)[0] + ".index"
+
+
+def videos_path(logpath: str) -> str:
+    """Returns the path of the video table that belongs to a normalized logfile."""
+    return os.path.splitext(logpath)[0] + ".videos"
+
+
+def checkpoint_path(logpath: str) -> str:
+    """Returns the path of the checkpoint (breakpoint file) that belongs to a logfile."""
+    return os.path.splitext(logpath)[0] + ".breakpoint"
+
+
+def is_normalized(logpath: str) -> bool:
+    """Checks whether a logfile is stored in the normalized format."""
+    return os.path.isfile(videos_path(logpath))
+
+
+class VideoTable:
+    """
+    The video table of a normalized logfile. Every video is stored once, as a line of
+    JSON [video_id, title, channel_id, first_seen], where first_seen is the number of the
+    logfile line in which the video appeared first. The table is only ever appended to,
+    so it is read incrementally: every read only parses the rows added since the last one.
+    """
+
+    def __init__(self, logpath: str) -> None:
+        self.path = videos_path(logpath)
+        self.videos: Dict[str, Tuple[str, str, int]] = {}
+        self.offset = 0
+
+    def refresh(self) -> "VideoTable":
+        """
+        Reads the rows that were appended to the table since it was last read.
+
+        :return: The table itself
+        """
+        with open(self.path, "rb") as table:
+            if table.seek(0, os.SEEK_END) < self.offset:
+                self.videos.clear()
+                self.offset = 0
+            table.seek(self.offset)
+            for row in table:
+                if not row.endswith(b"\n"):
+                    break
+                video_id, title, channel_id, first_seen = json.loads(row)
+                self.videos.setdefault(
+                    sys.intern(video_id), (title, sys.intern(channel_id), first_seen)
+                )
+                self.offset += len(row)
+        return self
+
+    def add(self, layers: List[Dict], line_number: int) -> bytes:
+        """
+        Adds the videos of one tree that are not part of the table yet.
+
+        :param layers: The layers of the tree
+        :param line_number: The number of the logfile line the tree is written to
+        :return: The encoded rows of the new videos, which have to be appended to the
+            table file
+        """
+        rows = []
+        for layer in layers:
+            for video_id, video_info in layer.items():
+                if video_id not in self.videos:
+                    _, title, channel_id = video_info
+                    self.videos[video_id] = (title, channel_id, line_number)
+                    row = [video_id, title, channel_id, line_number]
+                    rows.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        data = "".join(row + "\n" for row in rows).encode("utf-8")
+        self.offset += len(data)
+        return data
+
+    def expand_layer(self, pairs: List[Tuple[str, Optional[str]]]) -> Dict[str, VideoRecord]:
+        """
+        Builds one layer from the video IDs and related video IDs stored in a line of a
+        normalized logfile.
+
+        :param pairs: The (video_id, related_to) pairs of the layer
+        :return: The layer holding records
+        """
+        layer = {}
+        for video_id, parent_video_id in pairs:
+            title, channel_id, _ = self.videos[video_id]
+            layer[sys.intern(video_id)] = VideoRecord(parent_video_id, title, channel_id)
+        return layer
+
+
+_video_tables: Dict[str, VideoTable] = {}
+_dictionaries: Dict[str, bytes] = {}
+
+
+def video_table(logpath: str) -> VideoTable:
+    """
+    Returns the video table of a normalized logfile, read up to its current end. Tables
+    are kept in memory, so that reading many lines of a logfile parses its table once.
+
+    :param logpath: The path to the logfile
+    :return: The video table
+    """
+    key = os.path.abspath(logpath)
+    if key not in _video_tables:
+        _video_tables[key] = VideoTable(logpath)
+    return _video_tables[key].refresh()
+
+
+def _forget_logfile(logpath: str) -> None:
+    """Drops the video table and the compression dictionary of a logfile from memory
+    after the logfile was rewritten.
+    """
+    _video_tables.pop(os.path.abspath(logpath), None)
+    _dictionaries.pop(os.path.abspath(logpath), None)
+
+
+def _videos_of(logpath: str) -> Optional[VideoTable]:
+    """Returns the video table of a logfile, or None if the logfile is not normalized."""
+    return video_table(logpath) if is_normalized(logpath) else None
+
+
+def _reverse_rows(table: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """Yields the rows of a video table from the last one to the first, together with the
+    offset at which every row starts. The last row may be incomplete.
+    """
+    position = table.seek(0, os.SEEK_END)
+    buffer = b""
+    while position > 0:
+        start = max(position - READ_CHUNK_SIZE, 0)
+        table.seek(start)
+        buffer = table.read(position - start) + buffer
+        position = start
+        newline = buffer.rfind(b"\n", 0, len(buffer) - 1)
+        while newline != -1:
+            yield position + newline + 1, buffer[newline + 1 :]
+            buffer = buffer[: newline + 1]
+            newline = buffer.rfind(b"\n", 0, len(buffer) - 1)
+    if buffer:
+        yield 0, buffer
+
+
+def _trim_video_table(logpath: str, line_count: int) -> None:
+    """Removes the videos that first appeared after the first line_count lines of a
+    normalized logfile (or that were only partly written) from its video table. Rows are
+    appended in the order of the line they first appeared in, so only the end of the
+    table is read.
+    """
+    if not is_normalized(logpath):
+        return
+    with open(videos_path(logpath), "r+b") as table:
+        end = table.seek(0, os.SEEK_END)
+        for start, row in _reverse_rows(table):
+            if row.endswith(b"\n") and json.loads(row)[3] < line_count:
+                break
+            end = start
+        if table.seek(0, os.SEEK_END) > end:
+            logger.info("Discarding the videos after line %d: %s", line_count, table.name)
+            table.truncate(end)
+            _forget_logfile(logpath)
+
+
+def is_compressed(logpath: str) -> bool:
+    """Checks whether a logfile is stored as compressed frames."""
+    if not os.path.isfile(logpath):
+        return False
+    with open(logpath, "rb") as logfile:
+        # Every zlib frame starts with 0x78, while plain lines start with "["
+        return logfile.read(1) == b"\x78"
+
+
+def _iter_records(
+    logfile: BinaryIO, offset: int, dictionary: Optional[bytes] = None
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Reads the complete lines of a logfile from a byte offset on.
+
+    :param logfile: The logfile, opened in binary mode
+    :param offset: The byte offset of the first line
+    :param dictionary: The compression dictionary of a compressed logfile (None for a
+        plain logfile)
+    :return: An iterator over the byte offset where each line ends and the line itself
+    """
+    logfile.seek(offset)
+    if dictionary is None:
+        for line in logfile:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            yield offset, line
+        return
+
+    data = b""
+    while True:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        try:
+            line = decompressor.decompress(data)
+            fed = len(data)
+            while not decompressor.eof:
+                chunk = logfile.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                line += decompressor.decompress(chunk)
+                fed += len(chunk)
+        except zlib.error:
+            return
+        data = decompressor.unused_data
+        offset += fed - len(data)
+        yield offset, line
+
+
+def _dictionary_of(logpath: str) -> Optional[bytes]:
+    """
+    Returns the compression dictionary of a compressed logfile, which consists of the
+    first LOG_DICTIONARY_SIZE bytes of its lines, or None if the logfile is not
+    compressed. Frames are only compressed with the dictionary once the lines before
+    them fill it, so shorter dictionaries are never needed to read a frame.
+    """
+    if not is_compressed(logpath):
+        return None
+    key = os.path.abspath(logpath)
+    if key in _dictionaries:
+        return _dictionaries[key]
+    dictionary = b""
+    with open(logpath, "rb") as logfile:
+        for _, line in _iter_records(logfile, 0, b""):
+            dictionary = (dictionary + line)[:LOG_DICTIONARY_SIZE]
+            if len(dictionary) == LOG_DICTIONARY_SIZE:
+                _dictionaries[key] = dictionary
+                break
+    return dictionary
+
+
+class LogWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Appends the layers of trees to a logfile and keeps its offset index (and the video
+    table of a normalized logfile) up to date. A new logfile is normalized if normalized
+    is True and compressed if compressed is True, while an existing logfile keeps its
+    format. Should be used as a context manager.
+    """
+
+    def __init__(
+        self,
+        logpath: str,
+        truncate: bool = False,
+        normalized: bool = False,
+        compressed: bool = False,
+    ) -> None:
+        self.logpath = logpath
+        if not truncate:
+            ensure_index(logpath)
+            normalized = is_normalized(logpath)
+            compressed = is_compressed(logpath)
+        mode = "wb" if truncate else "ab"
+        self.logfile = open(logpath, mode)
+        self.indexfile = open(index_path(logpath), mode)
+        self.offset = self.logfile.seek(0, os.SEEK_END)
+        self.line_count = self.indexfile.seek(0, os.SEEK_END) // 8
+
+        self.videos: Optional[VideoTable] = None
+        self.videofile = None
+        self.dictionary: Optional[bytes] = None
+        if truncate:
+            _forget_logfile(logpath)
+            if not normalized and is_normalized(logpath):
+                os.remove(videos_path(logpath))
+        if normalized:
+            if not truncate:
+                _trim_video_table(logpath, self.line_count)
+            self.videofile = open(videos_path(logpath), mode)
+            self.videos = video_table(logpath)
+        if compressed:
+            self.dictionary = b"" if truncate else _dictionary_of(logpath)
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(self, layers: List[Dict]) -> None:
+        """
+        Appends the layers of one tree as a new line.
+
+        :param layers: The layers that were returned by get_layers
+        """
+        if self.videos is not None:
+            self.videofile.write(self.videos.add(layers, self.line_count))
+            self.videofile.flush()
+            line = (dump_normalized(layers) + "\n").encode("utf-8")
+        else:
+            line = (dump_layers(layers) + "\n").encode("utf-8")
+        line = self._compress(line)
+        self.logfile.write(line)
+        self.logfile.flush()
+        self.indexfile.write(array.array("Q", [self.offset]).tobytes())
+        self.indexfile.flush()
+        self.offset += len(line)
+        self.line_count += 1
+
+    def _compress(self, line: bytes) -> bytes:
+        """Compresses a line into a frame of its own if the logfile is compressed."""
+        if self.dictionary is None:
+            return line
+        if len(self.dictionary) < LOG_DICTIONARY_SIZE:
+            compressor = zlib.compressobj(COMPRESSION_LEVEL)
+            self.dictionary = (self.dictionary + line)[:LOG_DICTIONARY_SIZE]
+        else:
+            compressor = zlib.compressobj(
+                COMPRESSION_LEVEL,
+                zlib.DEFLATED,
+                zlib.MAX_WBITS,
+                zlib.DEF_MEM_LEVEL,
+                zlib.Z_DEFAULT_STRATEGY,
+                self.dictionary,
+            )
+        return compressor.compress(line) + compressor.flush()
+
+    def sync(self) -> None:
+        """Forces every appended line and its offset to be written to disk."""
+        if self.videofile is not None:
+            os.fsync(self.videofile.fileno())
+        os.fsync(self.logfile.fileno())
+        os.fsync(self.indexfile.fileno())
+
+    def close(self) -> None:
+        """Closes the logfile and its index."""
+        if self.videofile is not None:
+            self.videofile.close()
+        self.logfile.close()
+        self.indexfile.close()
+
+
+def write_layers(
+    logpath: str, layers: List[Dict], normalized: bool = False, compressed: bool = False
+) -> None:
+    """
+    Creates a new logfile that contains the layers of one tree.
+
+    :param logpath: The path to the logfile
+    :param layers: The layers that were returned by get_layers
+    :param normalized: If True, the logfile is stored in the normalized format
+    :param compressed: If True, the logfile is stored as compressed frames
+    """
+    with LogWriter(logpath, truncate=True, normalized=normalized, compressed=compressed) as writer:
+        writer.append(layers)
+
+
+def _last_indexed_line_end(logfile, indexfile, dictionary: Optional[bytes]) -> Optional[int]:
+    """Returns the byte offset where the last indexed line ends, or None if the index
+    does not match the logfile.
+    """
+    index_size = indexfile.seek(0, os.SEEK_END)
+    if index_size % 8:
+        return None
+    if index_size == 0:
+        return 0
+    indexfile.seek(index_size - 8)
+    offset = array.array("Q", indexfile.read(8))[0]
+    if offset > 0 and dictionary is None:
+        logfile.seek(offset - 1)
+        if logfile.read(1) != b"\n":
+            return None
+    record = next(_iter_records(logfile, offset, dictionary), None)
+    return record[0] if record else None
+
+
+def ensure_index(logpath: str) -> None:
+    """
+    Makes sure that the offset index of a logfile covers every line. A missing index is
+    built from scratch, lines that were appended without updating the index are added to
+    it, and an index that does not match the logfile is rebuilt.
+
+    :param logpath: The path to the logfile
+    """
+    if not os.path.isfile(logpath):
+        return
+    dictionary = _dictionary_of(logpath)
+    with open(logpath, "rb") as logfile, open(index_path(logpath), "a+b") as indexfile:
+        line_end = _last_indexed_line_end(logfile, indexfile, dictionary)
+        if line_end is None:
+            logger.info("Rebuilding offset index: %s", index_path(logpath))
+            indexfile.truncate(0)
+            line_end = 0
+
+        offsets = array.array("Q")
+        for end, _ in _iter_records(logfile, line_end, dictionary):
+            offsets.append(line_end)
+            line_end = end
+        indexfile.seek(0, os.SEEK_END)
+        indexfile.write(offsets.tobytes())
+
+
+def truncate_log(logpath: str, line_count: int, offset: int) -> None:
+    """
+    Cuts a logfile and its offset index back to a number of lines, discarding every line
+    that was appended afterwards.
+
+    :param logpath: The path to the logfile
+    :param line_count: The number of lines to keep
+    :param offset: The byte offset where the first discarded line starts
+    """
+    with open(logpath, "r+b") as logfile:
+        if logfile.seek(0, os.SEEK_END) > offset:
+            logger.info("Discarding the lines after line %d: %s", line_count, logpath)
+            logfile.truncate(offset)
+            _forget_logfile(logpath)
+    if os.path.isfile(index_path(logpath)):
+        with open(index_path(logpath), "r+b") as indexfile:
+            indexfile.truncate(min(indexfile.seek(0, os.SEEK_END), line_count * 8))
+    ensure_index(logpath)
+    _trim_video_table(logpath, line_count)
+
+
+def trim_partial_line(logpath: str) -> None:
+    """
+    Removes a line that was only partly written from the end of a logfile.
+
+    :param logpath: The path to the logfile
+    """
+    if is_compressed(logpath):
+        line_count = count_lines(logpath)
+        truncate_log(logpath, line_count, lines_end(logpath, line_count))
+        return
+
+    with open(logpath, "r+b") as logfile:
+        end = logfile.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - 4096, 0)
+            logfile.seek(start)
+            newline = logfile.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            logger.info("Discarding a partly written line: %s", logpath)
+            logfile.truncate(position)
+    ensure_index(logpath)
+    _trim_video_table(logpath, count_lines(logpath))
+
+
+def line_offset(logpath: str, line_number: int) -> int:
+    """
+    Looks up the byte offset of a line in the offset index of a logfile.
+
+    :param logpath: The path to the logfile
+    :param line_number: The number of the line, starting at 0
+    :return: The byte offset where the line starts
+    """
+    ensure_index(logpath)
+    with open(index_path(logpath), "rb") as indexfile:
+        indexfile.seek(line_number * 8)
+        offset_bytes = indexfile.read(8)
+    if len(offset_bytes) < 8:
+        raise IndexError(f"Line {line_number} does not exist in logfile: {logpath}")
+    return array.array("Q", offset_bytes)[0]
+
+
+def lines_end(logpath: str, line_count: int) -> int:
+    """
+    Returns the byte offset where the first lines of a logfile end.
+
+    :param logpath: The path to the logfile
+    :param line_count: The number of lines
+    :return: The byte offset after the last of these lines
+    """
+    if line_count == 0:
+        return 0
+    offset = line_offset(logpath, line_count - 1)
+    with open(logpath, "rb") as logfile:
+        return next(_iter_records(logfile, offset, _dictionary_of(logpath)))[0]
+
+
+def count_lines(logpath: str) -> int:
+    """
+    Returns the number of complete lines in a logfile according to its offset index.
+
+    :param logpath: The path to the logfile
+    :return: The number of lines
+    """
+    ensure_index(logpath)
+    return os.path.getsize(index_path(logpath)) // 8
+
+
+def read_layers_at(logpath: str, line_number: int) -> List[Dict]:
+    """
+    Reads the layers of a single line of a logfile by seeking to it directly.
+
+    :param logpath: The path to the logfile
+    :param line_number: The number of the line, starting at 0
+    :return: The layers stored in the line
+    """
+    offset = line_offset(logpath, line_number)
+    with open(logpath, "rb") as logfile:
+        _, line = next(_iter_records(logfile, offset, _dictionary_of(logpath)))
+    return parse_layers(line.decode("utf-8"), _videos_of(logpath))
+
+
+def iter_layers(logpath: str, start: int = 0, stop: Optional[int] = None) -> Iterator[List[Dict]]:
+    """
+    Lazily reads a logfile and yields the layers of one line at a time.
+
+    :param logpath: The path to the logfile
+    :param start: The number of the first line to read (found through the offset index)
+    :param stop: The number of the line at which reading stops (if not provided, the
+        logfile is read until the end)
+    :return: An iterator over the layers of every line
+    """
+    offset = lines_end(logpath, start)
+    videos = _videos_of(logpath)
+    dictionary = _dictionary_of(logpath)
+    with open(logpath, "rb") as logfile:
+        records = _iter_records(logfile, offset, dictionary)
+        for line_number, (_, line) in enumerate(records, start):
+            if stop is not None and line_number >= stop:
+                break
+            yield parse_layers(line.decode("utf-8"), videos)
+
+
+def _count_conflicts(videos: VideoTable, layers: List[Dict]) -> int:
+    """Counts the videos of a tree whose title or channel differs from their row in the
+    video table, which would be lost by storing the tree in the normalized format.
+    """
+    return sum(
+        1
+        for layer in layers
+        for video_id, video_info in layer.items()
+        if videos.videos[video_id][:2] != (video_info[1], video_info[2])
+    )
+
+
+def _rebase_checkpoint(logpath: str, line_count: int) -> None:
+    """
+    Points the byte offset saved in the checkpoint of a migrated logfile at the end of the
+    same line in the new byte layout. If the checkpoint covers more lines than the
+    logfile, the offset is dropped, so that only the partly written line is trimmed when
+    the calculation is continued.
+
+    :param logpath: The path to the migrated logfile
+    :param line_count: The number of lines of the migrated logfile
+    """
+    path = checkpoint_path(logpath)
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read()
+    if not content.lstrip().startswith("{"):
+        return
+    checkpoint = json.loads(content)
+    if "log_offset" not in checkpoint:
+        return
+    if checkpoint["log_lines"] <= line_count:
+        checkpoint["log_offset"] = lines_end(logpath, checkpoint["log_lines"])
+    else:
+        del checkpoint["log_offset"]
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(temp_path, path)
+
+
+def migrate_logfile(logpath: str, normalized: bool = False, compressed: bool = False) -> int:
+    """
+    Rewrites a logfile as JSON lines, either in the plain or in the normalized format,
+    and either uncompressed or as compressed frames. Logfiles in the legacy format are
+    migrated as well. The migrated file replaces the original one only after it has been
+    written completely, and the byte offset in its checkpoint is moved to the new layout.
+    The normalized format keeps only one title and channel per video,
+    so if any video appears with a different title or channel than where it appeared
+    first, the original logfile is kept next to the migrated one as <logfile>.bak.
+
+    :param logpath: The path to the logfile
+    :param normalized: If True, the logfile is rewritten in the normalized format
+    :param compressed: If True, the logfile is rewritten as compressed frames
+    :return: The number of migrated lines
+    """
+    temp_path = os.path.splitext(logpath)[0] + ".migrating.log"
+    conflicts = 0
+    with LogWriter(
+        temp_path, truncate=True, normalized=normalized, compressed=compressed
+    ) as writer:
+        for layers in iter_layers(logpath):
+            writer.append(layers)
+            if writer.videos is not None:
+                conflicts += _count_conflicts(writer.videos, layers)
+    if conflicts:
+        backup_path = logpath + ".bak"
+        os.replace(logpath, backup_path)
+        logger.warning(
+            "%d videos have a different title or channel than in the video table, keeping "
+            "the original logfile: %s",
+            conflicts,
+            backup_path,
+        )
+    if normalized:
+        os.replace(videos_path(temp_path), videos_path(logpath))
+    elif is_normalized(logpath):
+        os.remove(videos_path(logpath))
+    os.replace(temp_path, logpath)
+    os.replace(index_path(temp_path), index_path(logpath))
+    _forget_logfile(temp_path)
+    _forget_logfile(logpath)
+    _rebase_checkpoint(logpath, writer.line_count)
+    logger.info("Migrated %d lines: %s", writer.line_count, logpath)
+    return writer.line_count
+
+
+def migrate_logfiles(path: str, normalized: bool = False, compressed: bool = False) -> None:
+    """
+    Migrates a single logfile or every logfile in a folder to the JSON lines format.
+
+    :param path: The path to a logfile or to a folder containing logfiles
+    :param normalized: If True, the logfiles are migrated to the normalized format
+    :param compressed: If True, the logfiles are migrated to compressed frames
+    :return: None
+    """
+    logpaths = sorted(glob.glob(os.path.join(path, "*.log"))) if os.path.isdir(path) else [path]
+    for logpath in logpaths:
+        migrate_logfile(logpath, normalized, compressed)
@@ -7,16 +7,20 @@ for various configurations such as args.depth, args.width, and args.display opti
 
 import argparse
 import logging
+import os
 
-from googleapiclient.discovery import HttpError, build
-from helpers import parse_video_id
+from cache import CacheMissError
+from helpers import parse_video_id, response_cache
+from keypool import HttpError, KeyPool, QuotaExhaustedError
 from lib import (
+    DATA_PATH,
     calculate_aggressive,
     convert_imports,
     draw_tree,
     force_until_quota,
     get_titles,
 )
+from logstore import migrate_logfiles
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -109,12 +113,99 @@ def parse_args():
         default=None,
         help="Path to a logfile (will extract the video titles for further topic analysis)",
     )
+    parser.add_argument(
+        "-C",
+        "--channels",
+        default=False,
+        action="store_true",
+        help="Also save the titles grouped by channel as a TSV file when extracting titles",
+    )
+    parser.add_argument(
+        "-T",
+        "--topics",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Path(s) to .titles files (will run a topic analysis on the titles)",
+    )
+    parser.add_argument(
+        "-V",
+        "--visualize",
+        default=False,
+        action="store_true",
+        help="Show the topic visualizations after the topic analysis",
+    )
     parser.add_argument(
         "-a",
         "--apikey",
         type=str,
         default=None,
-        help="The API key to be used (if not provided, the first key from the list will be used)",
+        help="The API key to be used (if not provided, all keys from the list will be used)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to convert a logfile into a network graph",
+    )
+    parser.add_argument(
+        "-F",
+        "--full",
+        default=False,
+        action="store_true",
+        help="Convert every subtree of the logfile again instead of only the new ones",
+    )
+    parser.add_argument(
+        "-I",
+        "--channelids",
+        default=False,
+        action="store_true",
+        help="Build the network graph by channel ID and attach channel names as labels",
+    )
+    parser.add_argument(
+        "-M",
+        "--migrate",
+        type=str,
+        nargs="?",
+        const=DATA_PATH,
+        default=None,
+        help="Path to a logfile or folder of logfiles to migrate to JSON lines (default: data)",
+    )
+    parser.add_argument(
+        "-N",
+        "--normalized",
+        default=False,
+        action="store_true",
+        help="Store new (or migrated) logfiles with a video table instead of repeated titles",
+    )
+    parser.add_argument(
+        "-Z",
+        "--compress",
+        default=False,
+        action="store_true",
+        help="Store new (or migrated) logfiles as compressed frames, one frame per tree",
+    )
+    parser.add_argument(
+        "-r",
+        "--replay",
+        default=False,
+        action="store_true",
+        help="Serve API responses only from the response cache and fail on a cache miss",
+    )
+    parser.add_argument(
+        "-e",
+        "--expiry",
+        type=int,
+        default=30,
+        help="Number of days after which cached API responses expire (0 never expires)",
+    )
+    parser.add_argument(
+        "-b",
+        "--budget",
+        type=int,
+        default=None,
+        help="Maximum number of quota units to spend in this run (default: all remaining quota)",
     )
     args = parser.parse_args()
     return args
@@ -129,17 +220,34 @@ def main():
     """
     try:
         args = parse_args()
+        response_cache.replay = args.replay
+        response_cache.max_age = args.expiry * 24 * 60 * 60 if args.expiry > 0 else None
         api_keys = get_api_keys()
-        default_api_key = args.apikey if args.apikey else api_keys[0]
-        youtube = build("youtube", "v3", developerKey=default_api_key)
+        youtube = KeyPool([args.apikey] if args.apikey else api_keys, budget=args.budget)
         video_id = parse_video_id(args.seed) if args.seed else None
 
-        if not (args.importtrees or args.force or args.aggressive or args.titles):
-            draw_tree(youtube, video_id, args.width, args.depth, args.labels, args.graph)
+        if not (
+            args.importtrees
+            or args.force
+            or args.aggressive
+            or args.titles
+            or args.topics
+            or args.migrate
+        ):
+            draw_tree(
+                youtube,
+                video_id,
+                args.width,
+                args.depth,
+                args.labels,
+                args.graph,
+                args.normalized,
+                args.compress,
+            )
 
         elif args.importtrees:
             logfile = args.importtrees
-            convert_imports(logfile)
+            convert_imports(logfile, youtube, args.jobs, not args.full, args.channelids)
 
         elif args.force:
             force_until_quota(
@@ -148,6 +256,8 @@ def main():
                 args.width,
                 args.depth,
                 args.maxdepth,
+                args.normalized,
+                args.compress,
             )
 
         elif args.aggressive:
@@ -157,17 +267,33 @@ def main():
                 args.width,
                 args.depth,
                 args.maxdepth,
+                args.budget,
+                args.normalized,
+                args.compress,
             )
 
         elif args.titles:
             logfile = args.titles
-            get_titles(logfile)
+            get_titles(logfile, args.channels)
+
+        elif args.topics:
+            # BERTopic takes several seconds to import, so it is only loaded when needed
+            # pylint: disable-next=import-outside-toplevel
+            from topic_analysis import analyze_topics
+
+            output_path = os.path.splitext(args.topics[0])[0] + ".topics.csv"
+            analyze_topics(args.topics, output_path, visualize=args.visualize)
+
+        elif args.migrate:
+            migrate_logfiles(args.migrate, args.normalized, args.compress)
 
         else:
             logger.error("Invalid arguments. Please use -h or --help to see the available options.")
 
-    except HttpError as http_error:
-        logger.error("An error occurred: %s", http_error)
+    except (HttpError, QuotaExhaustedError) as error:
+        logger.error("An error occurred: %s", error)
+    except CacheMissError as error:
+        logger.error("Replay failed, the response is missing from the cache: %s", error)
     # except Exception as error:  # pylint: disable=broad-except
     #    logger.error("An unexpected error occurred: %s", error)
 
@@ -0,0 +1,182 @@
+"""This file contains the quota ledger that records how many quota units every API key has
+spent per day, and the planner that estimates the cost of a crawl before it starts.
+"""
+
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterator, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from cache import CACHE_PATH
+from ratelimit import LIST_COST, SEARCH_COST
+
+logger = logging.getLogger(__name__)
+
+
+QUOTA_LEDGER_FILE = os.path.join(CACHE_PATH, "quota.sqlite")
+QUOTA_TIMEZONE = "America/Los_Angeles"
+
+
+def quota_day() -> str:
+    """
+    Returns the current quota day. The quota of the Youtube Data API is reset at midnight
+    Pacific Time.
+
+    :return: The date of the current quota day in ISO format
+    """
+    try:
+        timezone = ZoneInfo(QUOTA_TIMEZONE)
+    except ZoneInfoNotFoundError:
+        timezone = datetime.timezone.utc
+    return datetime.datetime.now(timezone).date().isoformat()
+
+
+class QuotaLedger:
+    """
+    A persistent record of the quota units spent per API key and quota day, stored in a
+    local SQLite file, so that the quota spent by earlier runs on the same day is known.
+    """
+
+    def __init__(self, path: str = QUOTA_LEDGER_FILE) -> None:
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use."""
+        if self._connection is not None:
+            return self._connection
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "api_key TEXT, day TEXT, units INTEGER, PRIMARY KEY (api_key, day))"
+        )
+        self._connection = connection
+        return connection
+
+    def record(self, api_key: str, units: int, day: Optional[str] = None) -> None:
+        """
+        Adds spent quota units to the ledger.
+
+        :param api_key: The API key that spent the units
+        :param units: The number of quota units
+        :param day: The quota day (default: the current quota day)
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT INTO usage VALUES (?, ?, ?) "
+                    "ON CONFLICT (api_key, day) DO UPDATE SET units = units + excluded.units",
+                    (api_key, day or quota_day(), units),
+                )
+
+    def spent(self, api_key: str, day: Optional[str] = None) -> int:
+        """
+        Returns the quota units an API key has spent on one day.
+
+        :param api_key: The API key
+        :param day: The quota day (default: the current quota day)
+        :return: The number of spent quota units
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT units FROM usage WHERE api_key = ? AND day = ?",
+                    (api_key, day or quota_day()),
+                )
+                .fetchone()
+            )
+        return row[0] if row else 0
+
+
+def tree_cost(width: int, depth: int) -> int:
+    """
+    Estimates the cost of one call to get_layers. The root video info costs one list
+    call, and every video above the last layer is expanded with one search call.
+
+    :param width: The width of the tree (number of related videos per layer)
+    :param depth: The depth of the tree (number of layers)
+    :return: The cost in quota units
+    """
+    expansions = sum(width**layer for layer in range(depth))
+    return LIST_COST + expansions * SEARCH_COST
+
+
+def level_costs(width: int, depth: int, max_depth: int) -> Iterator[int]:
+    """
+    Estimates the cost of every level of a force run from scratch. The first level is
+    the seed tree, and every following level holds one tree per leaf of the level before,
+    until max_depth is reached. Since videos that show up more than once are only
+    expanded once, the estimates are upper bounds.
+
+    :param width: The width of one tree (number of related videos per layer)
+    :param depth: The depth of one tree (number of layers)
+    :param max_depth: The maximum overall depth of the crawl
+    :return: An iterator over the cost of each level in quota units
+    """
+    leaves_per_tree = width**depth
+    for level in range(max_depth // depth + 1):
+        yield leaves_per_tree**level * tree_cost(width, depth)
+
+
+def estimate_force_cost(width: int, depth: int, max_depth: int, limit: Optional[int] = None) -> int:
+    """
+    Estimates the cost of a complete force run from scratch. The cost grows exponentially
+    with the number of levels (with the default max_depth it has thousands of digits), so
+    the estimate stops as soon as it exceeds limit.
+
+    :param width: The width of one tree (number of related videos per layer)
+    :param depth: The depth of one tree (number of layers)
+    :param max_depth: The maximum overall depth of the crawl
+    :param limit: The number of quota units above which the estimate stops (default: no
+        limit)
+    :return: The cost in quota units, or the cost of the levels up to the first one that
+        exceeds limit
+    """
+    total = 0
+    for cost in level_costs(width, depth, max_depth):
+        total += cost
+        if limit is not None and total > limit:
+            break
+    return total
+
+
+def log_force_plan(width: int, depth: int, max_depth: int, available: int) -> None:
+    """
+    Logs the estimated cost of a force run and how far the available quota will get it.
+
+    :param width: The width of one tree (number of related videos per layer)
+    :param depth: The depth of one tree (number of layers)
+    :param max_depth: The maximum overall depth of the crawl
+    :param available: The quota units available for the run
+    :return: None
+    """
+    estimate = estimate_force_cost(width, depth, max_depth, limit=available)
+    if estimate <= available:
+        logger.info(
+            "Estimated cost of the crawl: %d of %d available quota units", estimate, available
+        )
+        return
+
+    levels = max_depth // depth + 1
+    total = 0
+    for level, cost in enumerate(level_costs(width, depth, max_depth)):
+        if total + cost > available:
+            logger.info(
+                "The %d available quota units cover %d of %d tree levels (%d units)",
+                available,
+                level,
+                levels,
+                total,
+            )
+            return
+        total += cost
+
+
+quota_ledger = QuotaLedger()
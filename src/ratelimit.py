@@ -0,0 +1,49 @@
+"""This file contains a rate limiter that spaces out Youtube Data API calls according to
+their cost in quota units.
+"""
+
+import threading
+import time
+
+UNITS_PER_MINUTE = 30000
+SEARCH_COST = 100
+LIST_COST = 1
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    """
+    Token bucket limiter measured in quota units. Threads that want to send a request
+    acquire the cost of that request and block until enough units have been refilled.
+    """
+
+    def __init__(self, units_per_minute: int = UNITS_PER_MINUTE) -> None:
+        self.units_per_minute = units_per_minute
+        self.available = float(units_per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Adds the units that have accumulated since the last refill."""
+        now = time.monotonic()
+        refill = (now - self.updated_at) * self.units_per_minute / 60
+        self.available = min(float(self.units_per_minute), self.available + refill)
+        self.updated_at = now
+
+    def acquire(self, units: int) -> None:
+        """
+        Blocks until the given number of quota units may be spent.
+
+        :param units: The cost of the request in quota units
+        """
+        units = min(units, self.units_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= units:
+                    self.available -= units
+                    return
+                wait = (units - self.available) * 60 / self.units_per_minute
+            time.sleep(wait)
+
+
+rate_limiter = RateLimiter()
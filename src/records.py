@@ -0,0 +1,97 @@
+"""This file contains the compact in-memory representation of the videos in the layers of
+a tree.
+"""
+
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+
+class VideoRecord:
+    """
+    One video of a layer: the ID of the video it is related to, its title and the ID of
+    its channel. Records use __slots__ instead of a list, and their video and channel IDs
+    are interned, so that the records of a crawl share one string per video and channel
+    instead of holding a copy for every time a video appears.
+
+    Records can still be indexed, unpacked and compared like the [related_to, title,
+    channel_id] lists that layers used to hold, so code that expects the list form keeps
+    working.
+    """
+
+    __slots__ = ("parent", "title", "channel_id")
+
+    def __init__(self, parent: Optional[str], title: str, channel_id: str) -> None:
+        self.parent = sys.intern(parent) if parent is not None else None
+        self.title = title
+        self.channel_id = sys.intern(channel_id)
+
+    @classmethod
+    def from_list(cls, video_info: Sequence) -> "VideoRecord":
+        """
+        Creates a record from the list form of a video.
+
+        :param video_info: A list of [related_to, title, channel_id] or a record
+        :return: The record
+        """
+        if isinstance(video_info, cls):
+            return video_info
+        return cls(video_info[0], video_info[1], video_info[2])
+
+    def to_list(self) -> List[Optional[str]]:
+        """Returns the list form [related_to, title, channel_id] of the record."""
+        return [self.parent, self.title, self.channel_id]
+
+    def __getitem__(self, index: Any) -> Any:
+        return (self.parent, self.title, self.channel_id)[index]
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return iter((self.parent, self.title, self.channel_id))
+
+    def __len__(self) -> int:
+        return 3
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (VideoRecord, list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"VideoRecord({self.parent!r}, {self.title!r}, {self.channel_id!r})"
+
+
+def compact_layer(pairs: Any) -> Dict[str, VideoRecord]:
+    """
+    Converts one layer (or the key-value pairs of one layer) into a layer of records
+    with interned video IDs.
+
+    :param pairs: A layer in list form, or an iterable of (video_id, video_info) pairs
+    :return: The layer holding records
+    """
+    if isinstance(pairs, dict):
+        pairs = pairs.items()
+    return {sys.intern(video_id): VideoRecord.from_list(info) for video_id, info in pairs}
+
+
+def compact_layers(layers: List[Dict]) -> List[Dict[str, VideoRecord]]:
+    """
+    Converts layers in list form into layers holding records.
+
+    :param layers: The layers, holding lists or records
+    :return: The layers holding records
+    """
+    return [compact_layer(layer) for layer in layers]
+
+
+def expand_layers(layers: List[Dict]) -> List[Dict[str, List[Optional[str]]]]:
+    """
+    Converts layers holding records back into the list form, e.g. for code that modifies
+    the videos in place.
+
+    :param layers: The layers, holding records or lists
+    :return: The layers holding lists of [related_to, title, channel_id]
+    """
+    return [
+        {video_id: list(video_info) for video_id, video_info in layer.items()} for layer in layers
+    ]
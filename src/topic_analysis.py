@@ -1,107 +1,269 @@
-"""BERTopic Topic Modeling This script performs topic modeling using the BERTopic
-library on a dataset stored in a CSV file.
+"""BERTopic Topic Modeling This module performs topic modeling using the BERTopic
+library on the video titles extracted by lib.get_titles.
 """
 
+import functools
+import hashlib
+import itertools
+import logging
+import os
 import re
+import sqlite3
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional
 
 import emoji
+import numpy as np
 import pandas as pd
 from nltk.corpus import stopwords
 from bertopic import BERTopic
+import sentence_transformers
+from cache import CACHE_PATH
 
-# DataFrame aus der CSV-Datei erstellen
-df = pd.read_csv("scholz.csv")  # Hier immer Datei-Name Anpassen
+logger = logging.getLogger(__name__)
 
-###
-# Data Cleaning
-###
-df["Text"] = df["Text"].apply(lambda x: str(x).lower() if not pd.isnull(x) else "")
 
+CHUNK_SIZE = 10000
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_FILE = os.path.join(CACHE_PATH, "embeddings.sqlite")
 
-# Großbuchstaben in Kleinbuchstaben umwandeln
-df["Text"] = df["Text"].apply(lambda x: x.lower())
-
-
-# Funktion zum Entfernen von Emojis
-def remove_emojis(text):
-    """Entfernt Emojis aus dem Text."""
-    if isinstance(text, str):
-        return emoji.demojize(text)
-    return ""
-
-
-df["Text"] = df["Text"].apply(remove_emojis)
-
-
-# Muster für Sonderzeichen definieren und aus den Daten löschen
+# Muster für Sonderzeichen definieren (wird nur einmal kompiliert)
 SPECIAL_CHARS_PATTERN = r"[!\?\/\,\:\-\_\(\)\[\]\;\"\'\&\–\„\“\|\.\+\#\%\@\^\*\<\>\`\~\,\...\$\】\【\■\—\…\’\”\№]"  # pylint: disable=line-too-long
-
-df["Text"] = df["Text"].apply(lambda x: re.sub(SPECIAL_CHARS_PATTERN, "", x))
-
-
-# Liste mit den zu löschenden Wörtern definieren und aus den Daten löschen
-words_to_delete = set(stopwords.words("english"))
-words_to_delete.update(set(stopwords.words("german")))
-words_to_delete = list(words_to_delete)
-
-df["Text"] = df["Text"].apply(
-    lambda x: " ".join([word for word in x.split() if word not in words_to_delete])
-)
-
-# Aktualisierte CSV-Datei speichern
-df.to_csv("clear.csv", index=False)
-
-
-###
-# Bert Topic Modeling
-###
-
-# DataFrame aus der CSV-Datei erstellen
-df = pd.read_csv("clear.csv")
-
-df["Text"] = df["Text"].astype(str)
-
-# BERTopic-Modell initialisieren
-model = BERTopic(verbose=True)
-
-# convert to list
-docs = df["Text"].to_list()
-
-# BERTopic-Modell trainieren
-topics, probabilities = model.fit_transform(docs)
-
-# Topic-Details zu den Themen abrufen
-topic_details = model.get_topic_info()
-
-# DataFrame aus den Themen-Details erstellen
-df_topic_details = pd.DataFrame(topic_details)
-
-# DataFrame in eine CSV-Datei speichern
-df_topic_details.to_csv("topic.csv", index=False)
-
-# print(model.get_topic(0))
-
-
-###
-# Visualisierung
-###
-
-# Intertopic Distance Map
-# v = model.visualize_topics()
-
-# Topic Word Scores
-# v = model.visualize_barchart()
-
-# Term score decline
-# v = model.visualize_term_rank()
-
-# Hierarchical Clustering mit Topics
-hierarchical_topics = model.hierarchical_topics(docs)
-v = model.visualize_hierarchy(hierarchical_topics=hierarchical_topics)
-# v = model.visualize_hierarchy()
-
-# Similarity Matrix
-v_1 = model.visualize_heatmap()
-
-v.show()
-v_1.show()
+SPECIAL_CHARS_REGEX = re.compile(SPECIAL_CHARS_PATTERN)
+
+
+@functools.lru_cache(maxsize=None)
+def stopword_set() -> FrozenSet[str]:
+    """Gibt die englischen und deutschen Stoppwörter als frozenset zurück."""
+    return frozenset(stopwords.words("english")) | frozenset(stopwords.words("german"))
+
+
+def clean_texts(texts: pd.Series) -> pd.Series:
+    """
+    Bereinigt einen Block von Texten mit vektorisierten pandas-Operationen:
+    Kleinschreibung, Emojis in Text umwandeln, Sonderzeichen und Stoppwörter entfernen.
+
+    :param texts: Die zu bereinigenden Texte
+    :return: Die bereinigten Texte mit demselben Index
+    """
+    if texts.empty:
+        return texts.astype(str)
+    index = texts.index
+    texts = texts.reset_index(drop=True)
+
+    # Großbuchstaben in Kleinbuchstaben umwandeln (fehlende Werte werden zu "")
+    texts = texts.fillna("").astype(str).str.lower()
+
+    # Emojis entfernen: ein einziger Aufruf pro Block statt einem pro Zeile. Zeilenumbrüche
+    # trennen die Texte und werden am Ende ohnehin zu Leerzeichen
+    texts = texts.str.replace("\n", " ", regex=False)
+    texts = pd.Series(emoji.demojize("\n".join(texts)).split("\n"))
+
+    # Sonderzeichen aus den Daten löschen
+    texts = texts.str.replace(SPECIAL_CHARS_REGEX, "", regex=True)
+
+    # Stoppwörter aus den Daten löschen
+    words = texts.str.split().explode()
+    words = words[words.notna() & ~words.isin(stopword_set())]
+    texts = words.groupby(level=0).agg(" ".join).reindex(texts.index, fill_value="")
+    return texts.set_axis(index)
+
+
+def iter_clean_titles(path: str, chunksize: int = CHUNK_SIZE) -> Iterator[pd.Series]:
+    """
+    Liest eine .titles-Datei (ein Titel pro Zeile, erzeugt von lib.get_titles) blockweise
+    ein und gibt die bereinigten Titel Block für Block zurück.
+
+    :param path: Der Pfad zur .titles-Datei
+    :param chunksize: Die Anzahl der Zeilen pro Block
+    :return: Ein Iterator über die bereinigten Blöcke
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        while True:
+            lines = [line.rstrip("\n") for line in itertools.islice(file, chunksize)]
+            if not lines:
+                return
+            yield clean_texts(pd.Series(lines, dtype=object))
+
+
+class EmbeddingCache:
+    """
+    Persistenter Cache für Satz-Embeddings in einer lokalen SQLite-Datei. Die Embeddings
+    werden über das Embedding-Modell und den Hash des Textes gefunden, sodass bei einer
+    erneuten Analyse nur neue Texte berechnet werden müssen.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_FILE) -> None:
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Öffnet die Datenbank bei der ersten Verwendung."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT, text_hash TEXT, vector BLOB, PRIMARY KEY (model, text_hash))"
+            )
+        return self._connection
+
+    def lookup(self, model_name: str, text_hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Sucht Embeddings im Cache.
+
+        :param model_name: Der Name des Embedding-Modells
+        :param text_hashes: Die Hashes der gesuchten Texte
+        :return: Ein Dictionary mit einem Eintrag für jeden gefundenen Hash
+        """
+        connection = self._connect()
+        cached = {}
+        for text_hash in set(text_hashes):
+            row = connection.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                (model_name, text_hash),
+            ).fetchone()
+            if row is not None:
+                cached[text_hash] = np.frombuffer(row[0], dtype=np.float32)
+        return cached
+
+    def store(self, model_name: str, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        Speichert berechnete Embeddings im Cache.
+
+        :param model_name: Der Name des Embedding-Modells
+        :param embeddings: Ein Dictionary, das Text-Hashes auf Embeddings abbildet
+        """
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [
+                    (model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                    for text_hash, vector in embeddings.items()
+                ],
+            )
+
+
+def hash_text(text: str) -> str:
+    """Gibt den Hash eines Textes zurück, unter dem sein Embedding gespeichert wird."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embed_documents(
+    docs: List[str],
+    embedding_model: Any,
+    model_name: str,
+    cache: Optional[EmbeddingCache] = None,
+) -> np.ndarray:
+    """
+    Berechnet die Embeddings von Dokumenten. Bereits berechnete Embeddings werden aus dem
+    Cache übernommen, und jeder neue Text wird nur einmal berechnet.
+
+    :param docs: Die bereinigten Dokumente
+    :param embedding_model: Das SentenceTransformer-Modell
+    :param model_name: Der Name des Modells, unter dem die Embeddings gespeichert werden
+    :param cache: Der Embedding-Cache (ohne Cache wird alles neu berechnet)
+    :return: Eine Matrix mit einem Embedding pro Dokument
+    """
+    hashes = [hash_text(doc) for doc in docs]
+    embeddings = cache.lookup(model_name, hashes) if cache is not None else {}
+
+    missing = {}
+    for doc, doc_hash in zip(docs, hashes):
+        if doc_hash not in embeddings:
+            missing.setdefault(doc_hash, doc)
+    logger.info("Computing %d embeddings (%d cached)", len(missing), len(embeddings))
+
+    if missing:
+        vectors = embedding_model.encode(list(missing.values()), show_progress_bar=True)
+        computed = dict(zip(missing, vectors))
+        if cache is not None:
+            cache.store(model_name, computed)
+        embeddings.update(computed)
+
+    return np.vstack([embeddings[doc_hash] for doc_hash in hashes])
+
+
+def load_documents(titles_paths: List[str], chunksize: int = CHUNK_SIZE) -> List[str]:
+    """
+    Liest und bereinigt die Titel aus einer oder mehreren .titles-Dateien.
+
+    :param titles_paths: Die Pfade zu den .titles-Dateien
+    :param chunksize: Die Anzahl der Zeilen, die auf einmal bereinigt werden
+    :return: Die bereinigten Titel
+    """
+    return [
+        doc
+        for path in titles_paths
+        for chunk in iter_clean_titles(path, chunksize)
+        for doc in chunk
+    ]
+
+
+def show_visualizations(model: BERTopic, docs: List[str]) -> None:
+    """
+    Zeigt die hierarchische Clusterung und die Ähnlichkeitsmatrix der Themen an.
+
+    :param model: Das trainierte BERTopic-Modell
+    :param docs: Die Dokumente, mit denen das Modell trainiert wurde
+    """
+    # Intertopic Distance Map
+    # v = model.visualize_topics()
+
+    # Topic Word Scores
+    # v = model.visualize_barchart()
+
+    # Term score decline
+    # v = model.visualize_term_rank()
+
+    # Hierarchical Clustering mit Topics
+    hierarchical_topics = model.hierarchical_topics(docs)
+    v = model.visualize_hierarchy(hierarchical_topics=hierarchical_topics)
+    # v = model.visualize_hierarchy()
+
+    # Similarity Matrix
+    v_1 = model.visualize_heatmap()
+
+    v.show()
+    v_1.show()
+
+
+def analyze_topics(
+    titles_paths: List[str],
+    output_path: Optional[str] = None,
+    embedding_model_name: str = EMBEDDING_MODEL,
+    cache: Optional[EmbeddingCache] = None,
+    visualize: bool = False,
+) -> pd.DataFrame:
+    """
+    Führt die Themenanalyse mit BERTopic auf den Titeln aus .titles-Dateien durch.
+
+    :param titles_paths: Die Pfade zu den .titles-Dateien
+    :param output_path: Der Pfad, unter dem die Themen-Details als CSV gespeichert werden
+        (ohne Pfad wird nichts gespeichert)
+    :param embedding_model_name: Der Name des SentenceTransformer-Modells
+    :param cache: Der Embedding-Cache (Standard: der Cache im cache-Ordner)
+    :param visualize: Wenn True, werden die Visualisierungen der Themen angezeigt
+    :return: Die Themen-Details als DataFrame
+    """
+    docs = load_documents(titles_paths)
+    logger.info("Analyzing the topics of %d titles", len(docs))
+
+    embedding_model = sentence_transformers.SentenceTransformer(embedding_model_name)
+    embeddings = embed_documents(
+        docs, embedding_model, embedding_model_name, cache or EmbeddingCache()
+    )
+
+    # BERTopic-Modell initialisieren und mit den vorberechneten Embeddings trainieren
+    model = BERTopic(embedding_model=embedding_model, verbose=True)
+    model.fit_transform(docs, embeddings=embeddings)
+
+    # Topic-Details zu den Themen abrufen
+    df_topic_details = pd.DataFrame(model.get_topic_info())
+    if output_path is not None:
+        df_topic_details.to_csv(output_path, index=False)
+        logger.info("Saved topics: %s", output_path)
+
+    if visualize:
+        show_visualizations(model, docs)
+    return df_topic_details
@@ -0,0 +1,61 @@
+"""Tests for continuing a tree calculation from its checkpoint."""
+
+import json
+
+import pytest
+from checkpoint import checkpoint_path, restore_checkpoint, write_checkpoint
+from logstore import LogWriter, iter_layers, migrate_logfile
+
+TREES = [
+    [{f"root{line}": [None, f"Root {line}", "UCa"]}, {f"leaf{line}": [f"root{line}", "", "UCb"]}]
+    for line in range(6)
+]
+
+
+def read_trees(logpath: str) -> list:
+    """Reads the layers of every line of a logfile in list form."""
+    return [
+        [{video_id: list(video_info) for video_id, video_info in layer.items()} for layer in layers]
+        for layers in iter_layers(logpath)
+    ]
+
+
+@pytest.mark.parametrize(
+    "before, after",
+    [
+        ((False, True), (False, False)),
+        ((True, False), (False, True)),
+        ((False, False), (True, False)),
+    ],
+)
+def test_restore_after_migration(tmp_path, before, after):
+    """A checkpoint still trims the logfile at a line end after it was migrated."""
+    logpath = str(tmp_path / "seed.log")
+    with LogWriter(logpath, truncate=True, normalized=before[0], compressed=before[1]) as writer:
+        for layers in TREES[:4]:
+            writer.append(layers)
+        write_checkpoint(writer, [1, 0, 0, 0, 0])
+        for layers in TREES[4:]:
+            writer.append(layers)
+
+    migrate_logfile(logpath, *after)
+    assert restore_checkpoint(logpath) == [1, 0, 0, 0, 0]
+    assert read_trees(logpath) == TREES[:4]
+
+
+def test_restore_with_stale_offset(tmp_path):
+    """An offset that does not end the saved lines is replaced by the offset index."""
+    logpath = str(tmp_path / "seed.log")
+    with LogWriter(logpath, truncate=True) as writer:
+        for layers in TREES:
+            writer.append(layers)
+        write_checkpoint(writer, [2, 0, 0, 0, 0])
+    with open(checkpoint_path(logpath), "r+", encoding="utf-8") as file:
+        checkpoint = json.load(file)
+        checkpoint["log_lines"] = 3
+        file.seek(0)
+        file.truncate()
+        json.dump(checkpoint, file)
+
+    restore_checkpoint(logpath)
+    assert read_trees(logpath) == TREES[:3]
@@ -0,0 +1,28 @@
+"""Tests for the normalized logfile format."""
+
+from logstore import LogWriter, iter_layers, videos_path
+
+TREES = [
+    [{f"root{line}": [None, f"Root {line}", "UCa"]}, {f"leaf{line}": [f"root{line}", "", "UCb"]}]
+    for line in range(3)
+]
+
+
+def test_writer_discards_videos_of_unwritten_lines(tmp_path):
+    """Rows that were added to the video table for a line that was never written (or were
+    only partly written) are removed when the logfile is opened again.
+    """
+    logpath = str(tmp_path / "seed.log")
+    with LogWriter(logpath, truncate=True, normalized=True) as writer:
+        for layers in TREES:
+            writer.append(layers)
+    with open(videos_path(logpath), "rb") as table:
+        rows = table.read()
+    with open(videos_path(logpath), "ab") as table:
+        table.write(b'["lost","Lost","UCc",3]\n["half","Ha')
+
+    with LogWriter(logpath) as writer:
+        writer.append(TREES[0])
+    with open(videos_path(logpath), "rb") as table:
+        assert table.read() == rows
+    assert len(list(iter_layers(logpath))) == 4
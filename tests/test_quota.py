@@ -0,0 +1,39 @@
+"""Tests for the quota estimates of force runs."""
+
+import logging
+import sys
+
+from main import parse_args
+from quota import estimate_force_cost, log_force_plan, tree_cost
+
+WIDTH, DEPTH = 3, 2
+
+
+def default_max_depth(monkeypatch) -> int:
+    """Returns the max depth the command line uses if -m is not given."""
+    monkeypatch.setattr(sys, "argv", ["main.py"])
+    return parse_args().maxdepth
+
+
+def test_estimate_stops_at_the_limit(monkeypatch):
+    """The estimate for the default max depth stays close to the limit."""
+    max_depth = default_max_depth(monkeypatch)
+    estimate = estimate_force_cost(WIDTH, DEPTH, max_depth, limit=10000)
+    assert 10000 < estimate < 10000 * (WIDTH**DEPTH + 1)
+
+
+def test_estimate_without_limit_is_exact():
+    """Without a limit, every level of a short crawl is summed."""
+    assert estimate_force_cost(WIDTH, DEPTH, 4) == (1 + 9 + 81) * tree_cost(WIDTH, DEPTH)
+
+
+def test_plan_for_the_default_max_depth_is_logged(monkeypatch, caplog):
+    """Logging the plan of a default run neither fails nor formats the full estimate."""
+    max_depth = default_max_depth(monkeypatch)
+    monkeypatch.setattr(logging, "raiseExceptions", True)
+    with caplog.at_level(logging.INFO, logger="quota"):
+        log_force_plan(WIDTH, DEPTH, max_depth, 10000)
+    assert caplog.messages == [
+        f"The 10000 available quota units cover 2 of {max_depth // DEPTH + 1} tree levels "
+        "(4010 units)"
+    ]